@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+
+import os
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import argparse
+import itertools
+import json
+import resource
+import sys
+import time
+
+import numpy as np
+
+from liveplot import LivePlotAgent, PlotServer
+
+'''
+Headless benchmark harness for the agent -> plot process -> window pipeline
+
+Runs LivePlotAgent with synthetic data_funcs over a grid of channel counts,
+samples per channel, window counts, plot kinds (line, multi, stacked,
+heatmap) and transports under Qt's offscreen platform, and writes one JSON
+line per configuration with end to end throughput, render fps, latency, cpu
+per process and peak rss.
+
+    python benchmark.py --channels 1,16 --samples 1000,100000 --windows 1,8 \
+        --kinds line,multi,heatmap --transports queue,shm -o bench.jsonl
+
+startup_s is the time from creating the agent until all its windows are up,
+--server takes the plot processes from a PlotServer started (and refilled
+between configurations) outside of the measurement, --dashboard opens the
+windows of a configuration as the panels of one dashboard.
+
+Linux only (cpu and rss of the plot processes come from /proc, summed over
+all of them, cpu_plot_max is the busiest one).
+
+'''
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+def __proc_cpu__(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        ### fields after the parenthesised command name, utime/stime are 14/15
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+def __proc_peak_rss__(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) * 1024
+    return None
+
+def __self_cpu__():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+def __synthetic__(channels, samples):
+    ### precomputed noise cycled through so data_func cost stays negligible
+    frames = np.random.default_rng(0).standard_normal((4, channels, samples))
+    counter = itertools.count()
+    return lambda: frames[next(counter) % 4]
+
+def __window_sums__(stats, field):
+    return sum(w.get(field, 0) for w in stats["windows"].values())
+
+def run_config(kind, channels, samples, windows, transport, render_clock,
+               clock, refresh, warmup, duration, wire_dtype=None, compress=None,
+               processes=1, server=None, dashboard=False, overload="latest",
+               render_budget=None):
+    start = time.perf_counter()
+    agent = LivePlotAgent(
+        clock=clock,
+        transport=transport,
+        render_clock=render_clock,
+        instrument=True,
+        processes=processes,
+        server=server,
+        overload=overload,
+        render_budget=render_budget,
+    )
+    settings = dict(
+        title=kind,
+        xlabel="x",
+        ylabel="y",
+        refresh_interval=refresh,
+        no_plots=channels,
+        plot_labels=None,
+        wire_dtype=wire_dtype,
+    )
+    if kind == "heatmap":
+        settings["compress"] = compress
+    if kind == "stacked":
+        ### multi window with every channel in one plot
+        settings["stacked"] = True
+    if dashboard:
+        agent.new_dashboard(
+            [
+                dict(
+                    settings,
+                    kind="multi" if kind == "stacked" else kind,
+                    data_func=__synthetic__(channels, samples),
+                )
+                for i in range(windows)
+            ]
+        )
+    else:
+        new_plot = {
+            "line": agent.new_liveplot,
+            "multi": agent.new_liveplot_multi,
+            "stacked": agent.new_liveplot_multi,
+            "heatmap": agent.new_liveplot_heatmap,
+        }[kind]
+        for i in range(windows):
+            new_plot(data_func=__synthetic__(channels, samples), **settings)
+    setup = time.perf_counter() - start
+    ### first frame needs every window up in its plot process
+    ready = agent.wait_ready(timeout=60)
+    startup = time.perf_counter() - start if ready else None
+
+    time.sleep(warmup)
+    pids = [shard.process.pid for shard in agent.shards]
+    before = agent.stats()
+    cpu_agent, cpu_plots = __self_cpu__(), [__proc_cpu__(pid) for pid in pids]
+    t0 = time.perf_counter()
+    time.sleep(duration)
+    elapsed = time.perf_counter() - t0
+    cpu_agent = __self_cpu__() - cpu_agent
+    cpu_plots = [__proc_cpu__(pid) - cpu for pid, cpu in zip(pids, cpu_plots)]
+    after = agent.stats()
+    peak_rss_plot = sum(__proc_peak_rss__(pid) or 0 for pid in pids)
+    agent.close()
+
+    rendered = __window_sums__(after, "rendered") - __window_sums__(before, "rendered")
+    latencies = [w["latency_ms"] for w in after["windows"].values() if "latency_ms" in w]
+    return {
+        "kind": kind,
+        "channels": channels,
+        "samples": samples,
+        "windows": windows,
+        "transport": transport,
+        "render_clock": render_clock,
+        "processes": len(pids),
+        "server": server is not None,
+        "dashboard": dashboard,
+        "overload": overload,
+        "render_budget": render_budget,
+        "wire_dtype": wire_dtype,
+        "compress": compress if kind == "heatmap" else None,
+        "clock": clock,
+        "refresh_interval": refresh,
+        "duration_s": elapsed,
+        "setup_s": setup,
+        "startup_s": startup,
+        "render_fps": rendered / elapsed / windows,
+        "frames_per_s": rendered / elapsed,
+        "samples_per_s": rendered * channels * samples / elapsed,
+        "sent_bytes_per_s": (after["bytes"] - before["bytes"]) / elapsed,
+        "stale": __window_sums__(after, "stale") - __window_sums__(before, "stale"),
+        "dropped": after.get("dropped", 0) - before.get("dropped", 0),
+        "latency_ms": float(np.mean(latencies)) if latencies else None,
+        "cpu_agent": cpu_agent / elapsed,
+        "cpu_plot": sum(cpu_plots) / elapsed,
+        "cpu_plot_max": max(cpu_plots) / elapsed,
+        "peak_rss_agent": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "peak_rss_plot": peak_rss_plot,
+    }
+
+def __ints__(text):
+    return [int(v) for v in text.split(",")]
+
+def __strs__(text):
+    return text.split(",")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="liveplot pipeline benchmark")
+    parser.add_argument("--channels", type=__ints__, default=[1, 8])
+    parser.add_argument("--samples", type=__ints__, default=[1000, 100000])
+    parser.add_argument("--windows", type=__ints__, default=[1, 4])
+    parser.add_argument("--kinds", type=__strs__, default=["line", "multi", "heatmap"])
+    parser.add_argument("--transports", type=__strs__, default=["queue", "shm"])
+    parser.add_argument("--render-clock", action="store_true",
+                        help="use the shared render clock instead of WorkerBees")
+    parser.add_argument("--wire-dtype", default=None,
+                        help="down convert frames on the wire, e.g. float32 or int16")
+    parser.add_argument("--compress", default=None,
+                        help="compress heatmap frames on the wire (zlib or lz4)")
+    parser.add_argument("--processes", type=__ints__, default=[1],
+                        help="plot process counts to compare")
+    parser.add_argument("--server", action="store_true",
+                        help="take pre started plot processes from a PlotServer")
+    parser.add_argument("--dashboard", action="store_true",
+                        help="open the windows as panels of one new_dashboard")
+    parser.add_argument("--overload", type=__strs__, default=["latest"],
+                        help="data_q overload policies to compare")
+    parser.add_argument("--render-budget", type=float, default=None,
+                        help="adaptive refresh rates within this fraction of the GUI thread")
+    parser.add_argument("--clock", type=float, default=0.01)
+    parser.add_argument("--refresh", type=float, default=0.02)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("-o", "--output", default=None,
+                        help="append JSON lines here instead of stdout")
+    args = parser.parse_args(argv)
+
+    out = open(args.output, "a") if args.output else sys.stdout
+    server = None
+    if args.server:
+        server = PlotServer(size=max(args.processes), refill=False)
+    grid = itertools.product(
+        args.kinds, args.channels, args.samples, args.windows, args.transports,
+        args.processes, args.overload,
+    )
+    for kind, channels, samples, windows, transport, processes, overload in grid:
+        if server is not None:
+            ### let the refilled processes finish importing before timing
+            server.fill()
+            time.sleep(args.warmup)
+        result = run_config(
+            kind, channels, samples, windows, transport, args.render_clock,
+            args.clock, args.refresh, args.warmup, args.duration,
+            args.wire_dtype, args.compress, processes, server, args.dashboard,
+            overload, args.render_budget,
+        )
+        result["python"] = sys.version.split()[0]
+        result["numpy"] = np.__version__
+        out.write(json.dumps(result) + "\n")
+        out.flush()
+    if server is not None:
+        server.close()
+    if out is not sys.stdout:
+        out.close()
+    return
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+'''
+Preallocated numpy buffers used on the plot process side
+
+RingBuffer keeps the last `history` samples of every channel of a streaming
+plot, so streaming windows only ever receive and copy the new samples
+
+HistoryStore keeps every sample of a streaming plot with a min/max level of
+detail pyramid built as samples arrive, so hours of data can be zoomed and
+panned at about the cost of drawing one screen of it
+
+'''
+
+class __RingBuffer__:
+    """
+    RingBuffer is a fixed size (channels, history) ring over the last axis.
+    Every sample is written twice, at i and i + history, so the ordered
+    history is always one contiguous slice and view() never copies.
+    """
+
+    def __init__(self, channels, history, dtype=np.float64):
+        self.channels = channels
+        self.history = history
+        self.buffer = np.zeros((channels, 2 * history), dtype=dtype)
+        self.head = 0  ### next write position, in [0, history)
+        self.count = 0
+
+    def __write__(self, start, block):
+        stop = start + block.shape[-1]
+        self.buffer[:, start:stop] = block
+        self.buffer[:, start + self.history : stop + self.history] = block
+
+    def extend(self, chunk):
+        chunk = np.atleast_2d(chunk)
+        n = chunk.shape[-1]
+        if n >= self.history:
+            chunk = chunk[:, -self.history :]
+            n = self.history
+        first = min(n, self.history - self.head)
+        self.__write__(self.head, chunk[:, :first])
+        if first < n:
+            ### wrapped around the end of the ring
+            self.__write__(0, chunk[:, first:])
+        self.head = (self.head + n) % self.history
+        self.count = min(self.count + n, self.history)
+        return self
+
+    def view(self):
+        """
+        Ordered (oldest to newest) view of the samples held so far.
+        """
+        stop = self.head + self.history
+        return self.buffer[:, stop - self.count : stop]
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
+        return self
+
+class __ChunkedArray__:
+    """
+    ChunkedArray is an append only (channels, n) array held in fixed size
+    chunks, growing it never copies what is already stored.
+    """
+
+    def __init__(self, channels, chunk, dtype=np.float64):
+        self.channels = channels
+        self.chunk = chunk
+        self.dtype = dtype
+        self.chunks = []
+        self.count = 0
+
+    def extend(self, block):
+        n = block.shape[-1]
+        done = 0
+        while done < n:
+            offset = self.count % self.chunk
+            if offset == 0:
+                self.chunks.append(np.empty((self.channels, self.chunk), dtype=self.dtype))
+            take = min(n - done, self.chunk - offset)
+            self.chunks[-1][:, offset : offset + take] = block[:, done : done + take]
+            done += take
+            self.count += take
+        return self
+
+    def slice(self, start, stop):
+        """
+        Samples [start, stop) as one array, a view when they sit in one chunk.
+        """
+        start, stop = max(start, 0), min(stop, self.count)
+        if stop <= start:
+            return np.empty((self.channels, 0), dtype=self.dtype)
+        first, last = start // self.chunk, (stop - 1) // self.chunk
+        if first == last:
+            base = first * self.chunk
+            return self.chunks[first][:, start - base : stop - base]
+        return np.concatenate(
+            [
+                self.chunks[i][
+                    :,
+                    max(start - i * self.chunk, 0) : min(stop - i * self.chunk, self.chunk),
+                ]
+                for i in range(first, last + 1)
+            ],
+            axis=1,
+        )
+
+class __HistoryStore__:
+    """
+    HistoryStore keeps every sample of a streaming plot in a ChunkedArray
+    plus a min/max pyramid over it, level k holding the min and max of each
+    factor**k samples. Levels are folded in incrementally on every extend(),
+    query() reads the coarsest level that still has a bucket or more per
+    bin of the requested range. Nothing is ever dropped, budget about
+    1 + 2 / (factor - 1) times the raw samples in memory.
+    """
+
+    def __init__(self, channels, dtype=np.float64, factor=4, chunk=1 << 16):
+        self.channels = channels
+        self.dtype = dtype
+        self.factor = factor
+        self.chunk = chunk
+        self.raw = __ChunkedArray__(channels, chunk, dtype)
+        self.levels = []  ### (mins, maxs) ChunkedArrays, level k at index k - 1
+
+    @property
+    def count(self):
+        return self.raw.count
+
+    def extend(self, chunk):
+        chunk = np.atleast_2d(chunk)
+        self.raw.extend(chunk)
+        source = (self.raw, self.raw)
+        size = self.factor
+        for k in range(64):
+            if k == len(self.levels):
+                if source[0].count < self.factor:
+                    break
+                ### coarser levels get smaller chunks, they grow slower
+                chunk_size = max(self.chunk // size, 1024)
+                self.levels.append(
+                    (
+                        __ChunkedArray__(self.channels, chunk_size, self.dtype),
+                        __ChunkedArray__(self.channels, chunk_size, self.dtype),
+                    )
+                )
+            mins, maxs = self.levels[k]
+            done = mins.count * self.factor
+            complete = (source[0].count - done) // self.factor
+            if complete == 0:
+                break
+            stop = done + complete * self.factor
+            shape = (self.channels, complete, self.factor)
+            mins.extend(source[0].slice(done, stop).reshape(shape).min(axis=-1))
+            maxs.extend(source[1].slice(done, stop).reshape(shape).max(axis=-1))
+            source = (mins, maxs)
+            size *= self.factor
+        return self
+
+    def query(self, lo, hi, bins):
+        """
+        Returns (x, y) of sample numbers lo to hi with y as (channels, points):
+        the raw samples if there are fewer than factor * bins of them, else
+        the min/max envelope of the chosen level, two points per bucket.
+        """
+        count = self.raw.count
+        ### one sample of margin either side so lines reach the view edges
+        lo = max(int(np.floor(lo)) - 1, 0)
+        hi = min(int(np.ceil(hi)) + 2, count)
+        if hi <= lo:
+            return np.arange(0), self.raw.slice(0, 0)
+        span = hi - lo
+        level, size = 0, 1
+        while level < len(self.levels) and size * self.factor * max(bins, 1) <= span:
+            level += 1
+            size *= self.factor
+        if level == 0:
+            return np.arange(lo, hi), self.raw.slice(lo, hi)
+
+        mins, maxs = self.levels[level - 1]
+        first = lo // size
+        last = min(-(-hi // size), mins.count)
+        lows, highs = mins.slice(first, last), maxs.slice(first, last)
+        starts = np.arange(first, last) * size
+        tail = last * size
+        if tail < hi:
+            ### newest samples, not a whole bucket of this level yet
+            rest = self.raw.slice(tail, hi)
+            lows = np.concatenate([lows, rest.min(axis=-1, keepdims=True)], axis=-1)
+            highs = np.concatenate([highs, rest.max(axis=-1, keepdims=True)], axis=-1)
+            starts = np.append(starts, tail)
+        envelope = np.empty((self.channels, 2 * len(starts)), dtype=self.dtype)
+        envelope[:, 0::2] = lows
+        envelope[:, 1::2] = highs
+        return np.repeat(starts, 2), envelope
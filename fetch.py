@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+
+import asyncio
+import heapq
+import inspect
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from queue import Empty
+
+import multiprocess as mp
+import numpy as np
+from multiprocess.reduction import ForkingPickler
+
+from transport import __StreamChunk__, encode_frame
+
+'''
+Agent side data_func scheduling
+
+FetchScheduler replaces the one FetchData thread per plot: a single scheduler
+thread keeps a heap of due times and hands data_func calls to a bounded
+thread pool (or to one asyncio loop thread for `async def` data_funcs), so
+hundreds of plots can share a handful of workers. A plot never has more than
+one call in flight, slow or failing calls back the plot off exponentially.
+
+FetchPool moves CPU heavy data_funcs (or a transform of their results) out
+of the agent's interpreter into worker processes, which put the frames on
+the data_q of the plot's plot process themselves and report back how many
+of them they dropped.
+
+'''
+
+MAX_BACKOFF = 64
+REPORT_INTERVAL = 0.5  ### seconds between a pool worker's drop reports
+
+class __FetchJob__:
+    """
+    FetchJob is the scheduling state of one plot's data_func.
+    """
+
+    def __init__(self, key, data_func, interval, timeout, kill_func):
+        self.key = key
+        self.data_func = data_func
+        self.interval = interval
+        self.timeout = timeout
+        self.kill_func = kill_func
+        self.is_async = inspect.iscoroutinefunction(data_func)
+        self.alive = True
+        self.busy = False
+        self.timed_out = False
+        self.started = 0.
+        self.failures = 0
+
+    def delay(self):
+        return self.interval * min(2 ** self.failures, MAX_BACKOFF)
+
+class __FetchScheduler__:
+    """
+    on_result(key, data, seconds) is called from a worker thread with every
+    successful data_func result, is_open(key) returns True (window open),
+    False (window gone, job is dropped and kill_func called) or None (not
+    reported yet, keep polling). Calls are skipped while is_paused(key) is
+    True, the job stays on its schedule.
+    """
+
+    def __init__(self, on_result, is_open, is_paused=None, workers=4, verbose=False):
+        self.on_result = on_result
+        self.is_open = is_open
+        self.is_paused = is_paused
+        self.verbose = verbose
+        self.pool = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="FetchData"
+        )
+        self.loop = None
+        self.jobs = {}
+        self.heap = []
+        self.order = itertools.count()
+        self.cond = threading.Condition()
+        self.active = True
+        threading.Thread(
+            target=self.__run__, daemon=True, name="Fetch scheduler thread"
+        ).start()
+
+    def add(self, key, data_func, interval, timeout=None, kill_func=None):
+        job = __FetchJob__(key, data_func, interval, timeout, kill_func)
+        with self.cond:
+            old = self.jobs.get(key)
+            if old is not None:
+                old.alive = False
+            self.jobs[key] = job
+            self.__push__(job, time.time())
+        return self
+
+    def remove(self, key):
+        with self.cond:
+            job = self.jobs.pop(key, None)
+            if job is not None:
+                job.alive = False
+        return job
+
+    def stop(self):
+        with self.cond:
+            self.active = False
+            for job in self.jobs.values():
+                job.alive = False
+            self.jobs.clear()
+            self.cond.notify()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        return self
+
+    def __push__(self, job, due):
+        ### caller holds self.cond
+        heapq.heappush(self.heap, (due, next(self.order), job))
+        self.cond.notify()
+
+    def __run__(self):
+        while True:
+            with self.cond:
+                while self.active:
+                    if self.heap and self.heap[0][0] <= time.time():
+                        break
+                    self.cond.wait(
+                        self.heap[0][0] - time.time() if self.heap else None
+                    )
+                if not self.active:
+                    return
+                due, _, job = heapq.heappop(self.heap)
+                if not job.alive:
+                    continue
+                self.__push__(job, max(due + job.delay(), time.time()))
+            self.__dispatch__(job)
+
+    def __dispatch__(self, job):
+        state = self.is_open(job.key)
+        if state is False:
+            if self.remove(job.key) is job and job.kill_func:
+                job.kill_func()
+            return
+        if self.is_paused is not None and self.is_paused(job.key):
+            return
+
+        now = time.time()
+        if job.busy:
+            ### previous call still running, never queue up a second one
+            if job.timeout and not job.timed_out and now - job.started > job.timeout:
+                job.timed_out = True
+                job.failures += 1
+                if self.verbose:
+                    print(f"data_func for key:{job.key} timed out, backing off")
+            return
+
+        job.busy = True
+        job.started = now
+        if job.is_async:
+            future = asyncio.run_coroutine_threadsafe(
+                self.__await__(job), self.__event_loop__()
+            )
+        else:
+            future = self.pool.submit(job.data_func)
+        future.add_done_callback(partial(self.__done__, job))
+
+    async def __await__(self, job):
+        if job.timeout:
+            return await asyncio.wait_for(job.data_func(), job.timeout)
+        return await job.data_func()
+
+    def __event_loop__(self):
+        ### only ever called from the scheduler thread
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=self.loop.run_forever, daemon=True, name="Fetch asyncio loop"
+            ).start()
+        return self.loop
+
+    def __done__(self, job, future):
+        seconds = time.time() - job.started
+        job.busy = False
+        if not job.alive or future.cancelled():
+            return
+        try:
+            data = future.result()
+        except Exception as e:
+            job.failures += 1
+            if self.verbose:
+                print(f"data_func for key:{job.key} failed: {e!r}")
+            return
+        if job.timed_out:
+            ### late result of a call we already gave up on
+            job.timed_out = False
+            return
+        job.failures = 0
+        self.on_result(job.key, data, seconds)
+
+def __pool_worker_main__(inbox, reports, data_qs, overload, queue_depth, instrument, verbose):
+    __PoolWorker__(
+        inbox, reports, data_qs, overload, queue_depth, instrument, verbose
+    ).run()
+
+class __PoolWorker__:
+    """
+    PoolWorker is the loop of one FetchPool process. It calls the data_funcs
+    of its jobs when due, runs their transforms on what it is given or
+    fetched, and puts every frame on the data_q of the plot process drawing
+    it, packed as the agent would (stream chunks, wire dtype, time stamps).
+    Frames dropped by the overload policy are counted per key and put on
+    `reports` every REPORT_INTERVAL seconds while there are any.
+    """
+
+    def __init__(self, inbox, reports, data_qs, overload, queue_depth, instrument, verbose):
+        self.inbox = inbox
+        self.reports = reports
+        self.dropped = {}
+        self.report_time = 0.
+        self.data_qs = data_qs
+        self.overload = overload
+        self.queue_depth = queue_depth
+        self.instrument = instrument
+        self.verbose = verbose
+        self.jobs = {}
+        self.heap = []
+        self.order = itertools.count()
+
+    def run(self):
+        while True:
+            timeout = max(self.heap[0][0] - time.time(), 0) if self.heap else None
+            if self.dropped:
+                ### come back in time to report them
+                timeout = min(timeout, REPORT_INTERVAL) if timeout is not None else REPORT_INTERVAL
+            try:
+                kind, key, payload = self.inbox.get(timeout=timeout)
+            except Empty:
+                kind = None
+            except (EOFError, OSError):
+                return
+            if kind == "stop":
+                return
+            if kind is not None:
+                self.__message__(kind, key, payload)
+            ### only what is due now, jobs falling behind are due again at
+            ### once and must not keep the inbox and the reports waiting
+            now = time.time()
+            while self.heap and self.heap[0][0] <= now:
+                due, _, job = heapq.heappop(self.heap)
+                if self.jobs.get(job["key"]) is job:
+                    self.__fetch__(job, due)
+            self.__report__()
+
+    def __report__(self):
+        if self.dropped and time.time() - self.report_time >= REPORT_INTERVAL:
+            self.report_time = time.time()
+            dropped, self.dropped = self.dropped, {}
+            self.reports.put(dropped)
+        return self
+
+    def __message__(self, kind, key, payload):
+        if kind == "add":
+            job, shard = payload
+            job = ForkingPickler.loads(job)
+            job.update(key=key, shard=shard, paused=False, failures=0)
+            self.jobs[key] = job
+            if job["data_func"] is not None:
+                heapq.heappush(self.heap, (time.time(), next(self.order), job))
+        elif kind == "feed":
+            job = self.jobs.get(key)
+            if job is not None:
+                self.__deliver__(job, *payload)
+        elif kind == "pause":
+            if key in self.jobs:
+                self.jobs[key]["paused"] = payload
+        elif kind == "remove":
+            self.jobs.pop(key, None)
+
+    def __fetch__(self, job, due):
+        delay = job["interval"] * min(2 ** job["failures"], MAX_BACKOFF)
+        heapq.heappush(self.heap, (max(due + delay, time.time()), next(self.order), job))
+        if job["paused"] and job["history"] is None:
+            return
+        try:
+            data = job["data_func"]()
+        except Exception as e:
+            job["failures"] += 1
+            if self.verbose:
+                print(f"data_func for key:{job['key']} failed: {e!r}")
+            return
+        job["failures"] = 0
+        self.__deliver__(job, data, time.time())
+
+    def __deliver__(self, job, data, stamp):
+        key = job["key"]
+        try:
+            if job["transform"] is not None:
+                data = job["transform"](data)
+        except Exception as e:
+            if self.verbose:
+                print(f"transform for key:{key} failed: {e!r}")
+            return
+        stream = job["history"] is not None
+        if stream:
+            chunk = np.atleast_2d(data)
+            if job["waterfall"]:
+                ### rows -> columns, the window ring runs over the last axis
+                chunk = chunk.T
+            data = __StreamChunk__(chunk[..., -job["history"]:], job["history"])
+        if job["wire"] is not None:
+            data = encode_frame(data, *job["wire"])
+        frames = {key: data}
+        if self.instrument:
+            frames["__stamps__"] = {key: (stamp, time.time())}
+        if job["max_lag"] and not stream:
+            frames["__deadlines__"] = {key: stamp + job["max_lag"]}
+        data_q = self.data_qs[job["shard"]]
+        if stream or self.overload == "block":
+            ### stream samples must all arrive
+            data_q.put(frames)
+            return
+        try:
+            if data_q.qsize() >= self.queue_depth:
+                self.dropped[key] = self.dropped.get(key, 0) + 1
+                return
+        except NotImplementedError:
+            pass
+        try:
+            data_q.put_nowait(frames)
+        except queue.Full:
+            self.dropped[key] = self.dropped.get(key, 0) + 1
+
+class __FetchPool__:
+    """
+    FetchPool runs data_funcs and transforms in `workers` processes forked
+    from the agent, each plot's job stays with one of them. The processes
+    inherit the data_q of every plot process (data_qs, indexed by shard), so
+    they must be started after all plot processes exist.
+
+    add(key, job, shard) takes the job as ForkingPickler bytes (see pack)
+    once the key is placed in a plot process, feed(key, data) then hands
+    raw data_func results or pushed chunks to the key's transform. dropped()
+    collects what the workers reported dropping since it was last called.
+    """
+
+    def __init__(self, workers, data_qs, overload="latest", queue_depth=2,
+                 instrument=False, verbose=False):
+        self.inboxes = []
+        self.processes = []
+        self.worker_of = {}
+        self.reports = mp.Queue()
+        for i in range(workers):
+            inbox = mp.Queue()
+            process = mp.Process(
+                target=__pool_worker_main__,
+                args=(inbox, self.reports, data_qs, overload, queue_depth, instrument, verbose),
+                name=f"Fetch pool worker {i}",
+            )
+            process.daemon = True
+            process.start()
+            self.inboxes.append(inbox)
+            self.processes.append(process)
+
+    @staticmethod
+    def pack(data_func, transform, interval, history, waterfall, wire, max_lag):
+        ### pickled here so a job that cannot cross processes fails in the caller
+        return bytes(ForkingPickler.dumps(
+            {
+                "data_func": data_func,
+                "transform": transform,
+                "interval": interval,
+                "history": history,
+                "waterfall": waterfall,
+                "wire": wire,
+                "max_lag": max_lag,
+            }
+        ))
+
+    def __inbox__(self, key):
+        worker = self.worker_of.get(key)
+        if worker is None:
+            ### fewest keys first
+            loads = [0] * len(self.inboxes)
+            for i in self.worker_of.values():
+                loads[i] += 1
+            worker = self.worker_of[key] = loads.index(min(loads))
+        return self.inboxes[worker]
+
+    def add(self, key, job, shard):
+        self.__inbox__(key).put(["add", key, (job, shard)])
+        return self
+
+    def feed(self, key, data, stamp=None):
+        self.__inbox__(key).put(["feed", key, (data, stamp or time.time())])
+        return self
+
+    def dropped(self):
+        ### {key: frames dropped} reported by the workers since the last call
+        dropped = {}
+        while True:
+            try:
+                report = self.reports.get_nowait()
+            except Empty:
+                return dropped
+            for key, n in report.items():
+                dropped[key] = dropped.get(key, 0) + n
+
+    def pause(self, key, paused):
+        if key in self.worker_of:
+            self.inboxes[self.worker_of[key]].put(["pause", key, paused])
+        return self
+
+    def remove(self, key):
+        worker = self.worker_of.pop(key, None)
+        if worker is not None:
+            self.inboxes[worker].put(["remove", key, None])
+        return self
+
+    def stop(self):
+        for inbox in self.inboxes:
+            inbox.put(["stop", None, None])
+        for process in self.processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+        return self
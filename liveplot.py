@@ -1,16 +1,21 @@
 #!/usr/bin/env python3
 
 import numpy as np
-from PyQt5.QtWidgets import QApplication
+import os
+import sys
 import time
 import threading
+import itertools
 
-from functools import partial
 import multiprocess as mp, queue
+from multiprocess import resource_tracker
 from queue import Empty
-import operator
 
-from windows import __LivePlotterWindow__, __LiveMultiWindow__, __LiveHeatMap__
+from stats import __FrameStats__
+from processing import __Derived__, scale_policy
+from fetch import __FetchScheduler__, __FetchPool__
+from transport import __SharedRing__, __StreamChunk__, CODECS, MAX_DIMS, encode_frame
+from recording import __Recorder__, __Recording__
 
 '''
 General threadsafe subprocessed live plotter using pyqtgraph 
@@ -22,155 +27,154 @@ workerbee, LivePlotterWindow, LiveMultWindow, LiveHeatMap, LiveWindowLike set up
 the plot styling and update system
 
 LivePlotProcess, LivePlotAgent, __Qapp_liveplot__ set up the data transfer
-ecosystem based on multiprocessing task/data queues
+ecosystem based on multiprocessing task/data queues, or on shared memory
+frame rings (see transport.py) with the data queue kept as fallback
+
+PlotShard is the agent side handle of one plot process, the agent can spread
+its windows over several of them so busy windows render on separate cores
+
+This module stays free of Qt: the plot process side lives in plotprocess.py
+and is only imported inside the plot processes. PlotServer keeps plot
+processes started and imported ahead of time for agents to take.
+LivePlotAgent(listen=...) also lets producers in other processes feed the
+first plot process over a local socket through PlotClient (plotsocket.py),
+serve() runs such a plot process on its own.
+new_liveplot*(pool=True / transform=f) run CPU heavy data_funcs or their
+post processing in worker processes (FetchPool, fetch.py) that feed the
+plot processes directly.
 
 '''
-###################################################################################
-def __Qapp_liveplot__(task_q, state_q, data_q, clock, verbose):
-    app = QApplication([])
-    try:
-        liveplot_instance = __LivePlotProcess__(
-            task_q, state_q, data_q, clock, app, verbose
-        )
-    except Exception as e:
-        raise e
-    # return liveplot_instance
-###################################################################################
-class __LivePlotProcess__:
-    def __init__(self, task_q, state_q, data_q, clock, app, verbose):
-        self.app = app
-        self.verbose = verbose
-        self.windows = {}
-        self.window_no = 0
-        self.clock_interval = clock
-        self.task_q = task_q
-        self.state_q = state_q
-        self.data_q = data_q
-        self.isalive = True
-        self.window_states = {}
-        self.main_loop()
-
-    def main_loop(self):
-
-        while self.isalive:
-            if len(self.windows) > 0 and self.state_q.empty():
-                for key in self.windows:
-                    self.window_states[str(key)] = not self.windows[str(key)].isHidden()
-                self.state_q.put(self.window_states)
-
-            if self.task_q.empty():
-                pass
-            else:
-                new_task = self.task_q.get()
-                if new_task[0] == "new_live_plot":
-                    ### task[1] should be window identifier key (any str)
-                    ### task[2] should be plotter kwargs
-                    if self.verbose:
-                        print("command received!!")
-                        print(new_task)
-                    self.new_window(new_task[1], **new_task[2])
-
-                elif new_task[0] == "new_multi_plot":
-                    if self.verbose:
-                        print("command received!!")
-                        print(new_task)
-                    self.new_multiwindow(new_task[1], **new_task[2])
-
-                elif new_task[0] == "new_heatmap":
-                    if self.verbose:
-                        print("command received!!")
-                        print(new_task)
-                    self.new_liveplot_heatmap(new_task[1], **new_task[2])
-
-                elif new_task[0] == "break":
-                    self.isalive = False
-                    if self.verbose:
-                        print("stopping process loop")
-
-            time.sleep(self.clock_interval)
-
-            self.app.processEvents()
+### rough relative render cost of one update of each window kind
+WINDOW_LOADS = {"new_live_plot": 1, "new_multi_plot": 2, "new_heatmap": 4}
 
-        if self.verbose:
-            print("Exiting LivePlotProcess")
-        self.__exit__(None, None, None)
+OVERLOAD_POLICIES = ("latest", "drop_oldest", "block")
 
-    def __enter__(self):
-        return self
+### stream history on the wire of archived plots, every sample must arrive
+ARCHIVE_HISTORY = sys.maxsize
 
-    def __exit__(self, exc_type, exc_value, traceback):
-        if self.verbose:
-            print("LivePlotProcess exiting ciao bella ciao")
-        return
+def __dummy_data__():
+    return np.array([[np.linspace(0, 1, 1000), np.random.rand(1000)]])
 
-    def __internal_data_func__(self, key):
-        try:
-            dict = self.data_q.get_nowait()
-            return dict[str(key)]
-        except Empty:
-            return np.array([])
-        except KeyError:
-            if self.verbose:
-                print("Keyerror, buffering")
-            return np.array([])
-        except Exception as e:
-            print(e)
-            return np.array([])
-
-    def new_window(self, key, **plot_kwargs):
-        ### we can pass a self function because it has no direct
-        ### link to the customer package which houses whatever
-        ### incompatible dll that cannot be pickled via Process
-        refresh_interval = plot_kwargs['refresh_interval']
-        if not refresh_interval:
-            plot_kwargs['refresh_interval'] = self.clock_interval * 5
+def __plot_process_main__(task_q, state_q, data_q, stats_q):
+    ### Qt and pyqtgraph only ever get imported here, in the plot process
+    from plotprocess import __Qapp_liveplot__
+    __Qapp_liveplot__(task_q, state_q, data_q, stats_q)
 
-        if self.verbose:
-            print(f"Refreshing plot at {refresh_interval}s")
+class __PlotShard__:
+    """
+    PlotShard owns one plot process and its task, state, data and stats
+    queues, plus the estimated load of every window key it draws. The
+    process starts importing right away but only runs once configure()d.
+    """
+
+    def __init__(self):
+        self.task_q = mp.Queue()
+        self.state_q = mp.Queue()
+        self.data_q = mp.Queue(maxsize=50)  ##need to play with buffer size
+        self.stats_q = mp.Queue()
+        self.plot_stats = {}
+        self.loads = {}
+        self.process = mp.Process(
+            target=__plot_process_main__,
+            args=(self.task_q, self.state_q, self.data_q, self.stats_q),
+        )
+        self.process.daemon = True
+        self.process.start()
 
-        self.windows[str(key)] = __LivePlotterWindow__(
-            data_func = partial(self.__internal_data_func__, str(key)),
-            **plot_kwargs,
-            verbose = self.verbose,
+    def configure(self, clock, verbose, render_clock, instrument, listen=None,
+                  render_budget=None):
+        self.task_q.put(
+            [
+                "configure",
+                None,
+                {
+                    "clock": clock,
+                    "verbose": verbose,
+                    "render_clock": render_clock,
+                    "instrument": instrument,
+                    "listen": listen,
+                    "render_budget": render_budget,
+                },
+            ]
         )
-        self.window_no += 1
+        if not instrument:
+            self.stats_q = None
         return self
-    
-    def new_multiwindow(self, key, **plot_kwargs):
-        ### we can pass a self function because it has no direct
-        ### link to the customer package which houses whatever
-        ### incompatible dll that cannot be pickled via Process
-        refresh_interval = plot_kwargs['refresh_interval']
-        if not refresh_interval:
-            plot_kwargs['refresh_interval'] = self.clock_interval * 5
 
-        if self.verbose:
-            print(f"Refreshing plot at {refresh_interval}s")
+    def load(self):
+        return sum(self.loads.values())
 
-        self.windows[str(key)] = __LiveMultiWindow__(
-            data_func = partial(self.__internal_data_func__, str(key)),
-            **plot_kwargs,
-            verbose = self.verbose,
-        )
-        self.window_no += 1
+    def stop(self):
+        self.task_q.put(["break", None, None])
+        ### frames still buffered for a plot process that is going away
+        ### must not hold up interpreter exit
+        self.data_q.cancel_join_thread()
         return self
 
-    def new_liveplot_heatmap(self, key, **plot_kwargs):
-        refresh_interval = plot_kwargs['refresh_interval']
-        if not refresh_interval:
-            plot_kwargs['refresh_interval'] = self.clock_interval * 5
+    def in_flight(self):
+        ### snapshots put on data_q and not yet taken by the plot process
+        try:
+            return self.data_q.qsize()
+        except NotImplementedError:
+            return 0 if self.data_q.empty() else 1
 
-        if self.verbose:
-            print(f"Refreshing plot at {refresh_interval}s")
+class PlotServer:
+    """
+    PlotServer keeps `size` plot processes started, with PyQt5 and pyqtgraph
+    imported and a QApplication up, so that LivePlotAgent(server=...) only
+    has to hand them their settings. Every process an agent takes is
+    replaced straight away when refill=True, otherwise on fill().
 
-        self.windows[str(key)] = __LiveHeatMap__(
-            data_func = partial(self.__internal_data_func__, str(key)),
-            **plot_kwargs,
-            verbose = self.verbose,
-        )
-        self.window_no += 1
+        server = PlotServer(size=2)
+        ...
+        with LivePlotAgent(server=server) as agent:
+            ...
+        server.close()
+    """
+
+    def __init__(self, size=1, refill=True):
+        self.size = size
+        self.refill = refill
+        self.lock = threading.Lock()
+        ### shm rings of later agents must be tracked by the tracker
+        ### these processes inherit
+        resource_tracker.ensure_running()
+        self.idle = [__PlotShard__() for i in range(size)]
+
+    def __enter__(self):
         return self
 
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def take(self, n=1):
+        with self.lock:
+            taken, self.idle = self.idle[:n], self.idle[n:]
+            ### more than we had warm start cold
+            taken += [__PlotShard__() for i in range(n - len(taken))]
+        if self.refill:
+            self.fill()
+        return taken
+
+    def fill(self):
+        """
+        Starts plot processes until `size` of them are idle again.
+        """
+        with self.lock:
+            self.idle += [__PlotShard__() for i in range(self.size - len(self.idle))]
+        return self
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for shard in idle:
+            shard.stop()
+        for shard in idle:
+            shard.process.join(timeout=1)
+            if shard.process.is_alive():
+                shard.process.terminate()
+        return
+
 class LivePlotAgent:
     """
     We want to try to phase towards using multiprocess.Process method instead
@@ -184,41 +188,174 @@ class LivePlotAgent:
     the live plotting subprocess.
     """
 
-    def __init__(self, clock=0.1, verbose=False):
+    def __init__(
+        self,
+        clock=0.1,
+        verbose=False,
+        transport="queue",
+        shm_slots=4,
+        max_send_rate=None,
+        render_clock=False,
+        instrument=False,
+        fetch_workers=4,
+        record=None,
+        processes=1,
+        assign="load",
+        server=None,
+        overload="latest",
+        queue_depth=2,
+        listen=None,
+        render_budget=None,
+        pool_workers=None,
+    ):
         """
         self.queue = something.Queue()
 
+        transport="queue" pickles data snapshots through data_q,
+        transport="shm" writes each key into its own shared memory frame ring
+        (falling back to data_q for data that cannot live in a flat buffer)
+
+        max_send_rate caps how many transmissions per second the broadcast
+        thread makes, changed keys are coalesced (latest value wins) in between.
+        None means send as soon as anything changes.
+
+        render_clock=True drives all windows from one QTimer tick in the plot
+        process (each window updated every refresh_interval / clock ticks)
+        instead of one WorkerBee thread per window.
+
+        instrument=True stamps every frame at fetch, send, receive and render,
+        read the figures back with stats(). Pass stats_overlay=True to a
+        new_liveplot* call to also draw fps and latency on that plot.
+
+        fetch_workers bounds the thread pool that runs every plot's data_func
+        (async def data_funcs share one asyncio loop thread instead), see
+        poll_interval and fetch_timeout on new_liveplot*.
+
+        record="some/dir" records every frame sent to the plot process, see
+        start_recording, replay it with ReplayAgent.
+
+        processes=N spreads the windows over N plot processes ("auto": half
+        the cores), each with its own queues, so a heavy window only slows
+        down the windows sharing its process. assign="load" puts each new
+        window on the process with the least estimated load (window kind
+        times refresh rate), assign="round_robin" just takes turns.
+
+        server=PlotServer(...) takes already started plot processes from the
+        server instead of starting and importing new ones, see wait_ready.
+
+        overload decides what happens to data_q when a plot process falls
+        behind. "latest" never has more than queue_depth snapshots in flight
+        per plot process, newer frames are coalesced in the agent (latest
+        value wins, stream chunks are merged) until it catches up. "drop_oldest"
+        takes the oldest queued snapshot back off data_q once queue_depth
+        are in flight, or drops the new one when the plot process is busy
+        reading (stream samples can be lost). "block" waits for room (up to
+        50 snapshots queued). Dropped and late frames are counted in stats(),
+        see also max_lag on new_liveplot*.
+
+        listen="unix:/tmp/liveplot.sock" (or "tcp:127.0.0.1:5555") makes the
+        first plot process accept PlotClient producers from other processes
+        on that local socket, next to this agent's own windows.
+
+        render_budget=0.5 makes refresh rates adaptive: each plot process
+        measures what every window costs to update and paint and slows
+        windows down (never below their refresh_interval) so drawing takes
+        at most that fraction of its GUI thread, the focused window first.
+        Minimized windows are paused and their data_funcs are not called
+        until they are shown again (streaming plots keep fetching).
+
+        pool_workers bounds the worker processes (default one per core) of
+        plots opened with pool=True or a transform, see new_liveplot. They
+        are started with the first such plot.
         """
+        if transport not in ("queue", "shm"):
+            raise ValueError(f"Unknown transport {transport}, use 'queue' or 'shm'")
+        if assign not in ("load", "round_robin"):
+            raise ValueError(f"Unknown assign {assign}, use 'load' or 'round_robin'")
+        if overload not in OVERLOAD_POLICIES:
+            raise ValueError(
+                f"Unknown overload policy {overload}, use {', '.join(OVERLOAD_POLICIES)}"
+            )
+        if processes == "auto":
+            processes = max(1, (os.cpu_count() or 2) // 2)
         self.clock_interval = clock
         self.verbose = verbose
-        self.task_q = mp.Queue()
-        self.state_q = mp.Queue()
-        self.data_q = mp.Queue(maxsize=50)  ##need to play with buffer size
-        self.process = mp.Process(
-            target=__Qapp_liveplot__,
-            args=(
-                self.task_q,
-                self.state_q,
-                self.data_q,
-                self.clock_interval,
-                self.verbose,
-            ),
-        )
-        self.process.daemon = True
-        self.process.start()
+        self.transport = transport
+        self.shm_slots = shm_slots
+        self.max_send_rate = max_send_rate
+        self.instrument = instrument
+        self.overload = overload
+        self.queue_depth = max(int(queue_depth), 1)
+        self.rings = {}
+        self.assign = assign
+        if self.transport == "shm":
+            ### the plot process has to share our resource tracker, its own
+            ### would unlink every ring it attached to when it exits
+            resource_tracker.ensure_running()
+        processes = max(int(processes), 1)
+        if server is not None:
+            self.shards = server.take(processes)
+        else:
+            self.shards = [__PlotShard__() for i in range(processes)]
+        for i, shard in enumerate(self.shards):
+            shard.configure(
+                self.clock_interval, self.verbose, render_clock, instrument,
+                listen if i == 0 else None, render_budget,
+            )
+        self.shard_of = {}
+        self.turns = itertools.count()
+        ### queues and process of the first plot process
+        first = self.shards[0]
+        self.task_q, self.state_q, self.data_q = first.task_q, first.state_q, first.data_q
+        self.stats_q, self.process = first.stats_q, first.process
         self.window_no = 0
         self.available_window_keys = []
         self.data = {}
+        self.streams = {}
+        self.waterfalls = set()
+        self.wire = {}
+        self.chunks = {}
+        self.last_key = None
+        self.last_keys = []
+        self.dirty_keys = set()
+        self.released = set()  ### closed keys whose rings the broadcast thread drops
+        self.opening = set()  ### keys sent to a plot process, not reported up yet
+        self.ready_cond = threading.Condition()
+        self.data_cond = threading.Condition()
+        self.fetch_stamps = {}
+        self.lag_budgets = {}
+        self.restarts = set()  ### stream keys whose next chunk starts the window over
+        self.key_stats = {}
+        self.link_stats = __FrameStats__()
+        self.plot_stats = {}
         self.states = {}
+        self.paused = set()  ### keys whose window is minimized
+        self.pool = None
+        self.pool_workers = pool_workers or os.cpu_count() or 1
+        self.pooled = {}  ### key -> (pool job, kill_func of a pool data_func)
+        self.plot_specs = {}
+        self.panels = None  ### collects the windows of a dashboard being built
+        self.recorder = None
         self.active = True
+        self.fetcher = __FetchScheduler__(
+            self.__fetched__,
+            lambda key: self.states.get(key),
+            is_paused=lambda key: key in self.paused and key not in self.streams,
+            workers=fetch_workers,
+            verbose=self.verbose,
+        )
         threading.Thread(
             target=self.__transmit_data__, daemon=True, name="Data broadcast thread"
         ).start()
-        threading.Thread(
-            target=self.__check_states__,
-            daemon=True,
-            name="Window isalive state check thread",
-        ).start()
+        for shard in self.shards:
+            threading.Thread(
+                target=self.__check_states__,
+                args=(shard,),
+                daemon=True,
+                name="Window isalive state check thread",
+            ).start()
+        if record is not None:
+            self.start_recording(record)
         if self.verbose:
             print("LivePlotAgent initialised")
 
@@ -227,152 +364,1028 @@ class LivePlotAgent:
 
     def __exit__(self, exc_type, exc_value, traceback):
         self.active = False
-        self.task_q.put(["break", None, None])
+        self.fetcher.stop()
+        if self.pool is not None:
+            self.pool.stop()
+        with self.data_cond:
+            self.data_cond.notify_all()
+        self.stop_recording()
+        for shard in self.shards:
+            shard.stop()
         if self.verbose:
             print("command sent!")
         time.sleep(1)
         self.__flush_queues__()
-        self.process.terminate()
+        for shard in self.shards:
+            shard.process.terminate()
+        for key in list(self.rings):
+            self.rings.pop(key).close()
         return self
 
     def __flush_queues__(self):
 
         def __internal_flush__(self, queue):
-            while not queue.empty():
+            ### stop at the first Empty, a reader stuck holding the queue
+            ### lock keeps empty() False forever
+            while True:
                 try:
                     queue.get_nowait()
-                except Empty:
-                    pass
-            return 
+                except (Empty, OSError, EOFError):
+                    return
         if self.verbose:
             print("flushing memory queues")
         # self.task_q.close()
         # self.state_q.close()
         # self.data_q.close()
-        while not self.task_q.empty():
-            __internal_flush__(self, self.task_q)
-        while not self.state_q.empty():
-            __internal_flush__(self, self.state_q)
-        while not self.data_q.empty():
-            __internal_flush__(self, self.data_q)
+        for shard in self.shards:
+            __internal_flush__(self, shard.task_q)
+            __internal_flush__(self, shard.state_q)
+            __internal_flush__(self, shard.data_q)
+            if shard.stats_q is not None:
+                __internal_flush__(self, shard.stats_q)
         return self
 
-    def __fetch_data__(self, data_func, key, kill_func):
-        alive = True
-        start = time.time()
-
-        while time.time() - start < 5:
-            self.data[str(key)] = data_func()
-            time.sleep(self.clock_interval)
+    def __fetched__(self, key, data, seconds):
+        ### called from the fetch pool with every data_func result,
+        ### streaming plots append whatever data_func returns
+        if self.instrument:
+            self.__key_stats__(key).time("fetch", seconds)
+        if key in self.pooled:
+            self.__feed__(key, data)
+        elif key in self.streams:
+            self.push(key, data)
+        else:
+            self.__publish__(key, data)
+        return
 
-        while alive:
-            try:
-                window_isopen = self.states[str(key)]
-                if window_isopen:
-                    self.data[str(key)] = data_func()
-                    time.sleep(self.clock_interval)
-                else:
-                    if kill_func:
-                        kill_func()
-                    alive = False
-            except KeyError as e:
-                pass
+    def __key_stats__(self, key):
+        stats = self.key_stats.get(str(key))
+        if stats is None:
+            stats = self.key_stats[str(key)] = __FrameStats__()
+        return stats
 
-        if self.verbose:
-            print("thread exiting!!!!!!!!!!!")
+    def __publish__(self, key, data):
+        ### called by the fetch threads, marks the key dirty and wakes
+        ### the broadcast thread
+        key = str(key)
+        with self.data_cond:
+            if self.instrument:
+                self.__key_stats__(key).count("published")
+                if key in self.dirty_keys:
+                    ### previous frame never left the agent
+                    self.__key_stats__(key).count("coalesced")
+            if self.instrument or key in self.lag_budgets:
+                self.fetch_stamps[key] = time.time()
+            self.data[key] = data
+            self.dirty_keys.add(key)
+            self.data_cond.notify()
         return
 
+    def push(self, key, chunk):
+        """
+        Append new samples to a streaming plot (see new_liveplot(stream=True)),
+        chunk is (channels, n) or (n,) for a single channel. Only the new
+        samples travel to the plot process.
+
+        Waterfall heatmaps (new_liveplot_heatmap(stream=True)) take new rows
+        instead, (n, bins) or (bins,) for a single row.
+        """
+        key = str(key)
+        if key not in self.streams:
+            raise KeyError(f"Key {key} is not a streaming plot")
+        if key in self.pooled:
+            ### the transform gets the chunk as it was pushed
+            return self.__feed__(key, chunk)
+        chunk = np.atleast_2d(chunk)
+        if key in self.waterfalls:
+            ### rows -> columns, the window ring runs over the last axis
+            chunk = chunk.T
+        return self.__append__(key, chunk)
+
+    def __feed__(self, key, data):
+        ### raw data of a plot with a transform goes to its pool worker,
+        ### whatever comes before the key is placed in a plot process is
+        ### dropped (the worker only learns where to send it then)
+        if key in self.shard_of:
+            self.pool.feed(key, data)
+        return self
+
+    def __pool__(self):
+        if self.pool is None:
+            ### workers fork off here and inherit every plot process' data_q
+            self.pool = __FetchPool__(
+                self.pool_workers,
+                [shard.data_q for shard in self.shards],
+                self.overload,
+                self.queue_depth,
+                self.instrument,
+                self.verbose,
+            )
+        return self.pool
+
+    def __append__(self, key, chunk):
+        with self.data_cond:
+            if self.instrument:
+                self.__key_stats__(key).count("published")
+                self.fetch_stamps[key] = time.time()
+            self.chunks[key].append(chunk)
+            self.dirty_keys.add(key)
+            self.data_cond.notify()
+        return self
+
+    def __drain_chunks__(self, key):
+        history = self.streams[key]
+        chunks, self.chunks[key] = self.chunks[key], []
+        if not chunks:
+            return None
+        try:
+            data = np.concatenate(chunks, axis=-1)
+        except ValueError:
+            ### channel count changed mid stream, keep the newest chunk
+            data = chunks[-1]
+        restart = key in self.restarts
+        self.restarts.discard(key)
+        return __StreamChunk__(data[..., -history:], history, restart)
+
     def __transmit_data__(self):
         if self.verbose:
             print("starting transmission data thread")
+        min_period = 1 / self.max_send_rate if self.max_send_rate else 0
+        last_send = 0
         while self.active:
-            if True in self.states.values():
-                self.data_q.put(self.data)
-            time.sleep(1e-20)
+            with self.data_cond:
+                ### sleep until a fetch thread publishes something new, keys
+                ### not placed in a plot process yet (dashboards being built)
+                ### or held back for a busy one stay dirty until they can go
+                ready = set()
+                while self.active and not self.released:
+                    ready = self.__ready_keys__()
+                    if ready:
+                        break
+                    self.data_cond.wait(self.clock_interval if self.dirty_keys else None)
+                changed = {}
+                for key in ready:
+                    if key in self.streams:
+                        payload = self.__drain_chunks__(key)
+                    else:
+                        payload = self.data[key]
+                    ### keys the plot process has not reported yet count as open
+                    if payload is not None and self.states.get(key, True):
+                        changed[key] = payload
+                self.dirty_keys -= ready
+                released, self.released = self.released, set()
+                if self.lag_budgets:
+                    self.__drop_late__(changed)
 
-    def __check_states__(self):
-        while self.active:
-            if not self.state_q.empty():
-                try:
-                    states = self.state_q.get()
-                    self.states = states
-                    self._garbage_collection_()
-                    self.available_window_keys = list(
-                        map(
-                            str,
-                            np.arange(0, len(self.states), 1)[
-                                list(map(operator.not_, self.states.values()))
-                            ],
-                        )
-                    )
-                except (Empty, KeyError) as e:
-                    pass
-            time.sleep(2)
-
-    def _garbage_collection_(self):
-        for key in self.states:
-            if not self.states[key] and key not in self.available_window_keys:
-                if self.verbose:
-                    print(f"Cleaning data for key:{key}")
-                self.data[key] = np.array([])
-
-    def __new_plot_prep__(self, data_func=None, kill_func=None):
-        avail_win = None
-        if len(self.available_window_keys) > 0:
-            avail_win = min(self.available_window_keys)
-
-        if avail_win and self.window_no - int(avail_win) > 1:
-            key = avail_win
+            for key in released:
+                ### only this thread touches the rings, so closed windows'
+                ### rings go here, before anything else is written
+                if key in self.rings:
+                    self.rings.pop(key).close()
+
+            if changed:
+                if self.recorder is not None:
+                    self.recorder.record(dict(changed), time.time())
+                shared = self.transport == "shm"
+                for key in changed.keys() & self.wire.keys():
+                    changed[key] = self.__encode__(key, changed[key], shared)
+                stamps = self.__stamp__(changed) if self.instrument else None
+                if shared:
+                    self.__share_data__(changed, stamps)
+                else:
+                    for shard, frames in self.__by_shard__(changed, stamps).items():
+                        self.__send__(shard, frames)
+
+            ### rate cap, anything published meanwhile is coalesced
+            wait = min_period - (time.time() - last_send)
+            if wait > 0:
+                time.sleep(wait)
+            last_send = time.time()
+
+    def __ready_keys__(self):
+        ### caller holds self.data_cond
+        ready = self.dirty_keys.intersection(self.shard_of)
+        if not ready or (self.overload != "latest" and not self.lag_budgets):
+            return ready
+        if self.overload == "latest":
+            capped = self.shards
         else:
-            key = str(self.window_no)
-            self.window_no += 1
+            ### a plot with a lag budget caps the queue of its plot process
+            ### at queue_depth whatever the policy, so its frames never wait
+            ### behind more snapshots than that
+            capped = {
+                self.shard_of.get(key)
+                for key in list(self.lag_budgets)
+                if key not in self.streams
+            }
+        busy = {
+            shard
+            for shard in capped
+            if shard is not None and shard.in_flight() >= self.queue_depth
+        }
+        if not busy:
+            return ready
+        ### shared rings never back up, only what goes through data_q waits
+        return {
+            key
+            for key in ready
+            if self.shard_of[key] not in busy
+            or (self.transport == "shm" and key not in self.streams)
+        }
 
-        if self.verbose:
-            print(f"Key: {key}")
-        ### some dummy data if data func is None
-        if not data_func:
-            data_func = lambda: np.array(
-                [[np.linspace(0, 1, 1000), np.random.rand(1000)]]
-            )
+    def __drop_late__(self, changed):
+        ### caller holds self.data_cond, frames already older than their
+        ### plot's lag budget are not sent, the next fetch replaces them
+        now = time.time()
+        for key in list(changed):
+            budget = self.lag_budgets.get(key)
+            if budget is None or key in self.streams:
+                continue
+            if now - self.fetch_stamps.get(key, now) > budget:
+                del changed[key]
+                self.__key_stats__(key).count("late")
+        return changed
 
-        self.data[key] = data_func()
-        self.states[key] = True
+    def __send__(self, shard, frames, wait=True):
+        if self.overload == "drop_oldest" and shard.in_flight() >= self.queue_depth:
+            try:
+                self.__dropped__(shard.data_q.get_nowait())
+            except Empty:
+                ### the plot process holds the read lock while it waits for
+                ### data, so the newest has to go instead
+                self.__dropped__(frames)
+                return self
+        if wait and self.overload == "block":
+            shard.data_q.put(frames)
+            return self
+        try:
+            shard.data_q.put_nowait(frames)
+        except queue.Full:
+            self.__dropped__(frames)
+        return self
 
-        threading.Thread(
-            target=self.__fetch_data__,
-            args=(
-                data_func,
-                key,
-                kill_func,
-            ),
-            daemon=True,
-            name="FetchData thread for key {}".format(key),
-        ).start()
-        return key
+    def __dropped__(self, frames):
+        for key in frames:
+            if not key.startswith("__"):
+                self.__key_stats__(key).count("dropped")
+                self.link_stats.count("dropped")
+        return self
+
+    def __encode__(self, key, data, shared=False):
+        wire_dtype, compress = self.wire[key]
+        return encode_frame(data, wire_dtype, compress, shared)
+
+    def __stamp__(self, changed):
+        ### (fetch, send) time stamps per key, plus link counters
+        now = time.time()
+        nbytes = 0
+        for data in changed.values():
+            if isinstance(data, __StreamChunk__):
+                data = data.data
+            nbytes += getattr(data, "nbytes", 0)
+        self.link_stats.count("sent").count("bytes", nbytes)
+        return {key: (self.fetch_stamps.get(key, 0.), now) for key in changed}
 
+    def __by_shard__(self, changed, stamps=None):
+        ### split one snapshot into one per plot process
+        snapshots = {}
+        for key, data in changed.items():
+            shard = self.shard_of.get(key)
+            if shard is not None:
+                snapshots.setdefault(shard, {})[key] = data
+        if stamps is not None:
+            for frames in snapshots.values():
+                frames["__stamps__"] = {key: stamps[key] for key in frames}
+        if self.lag_budgets:
+            for frames in snapshots.values():
+                ### frames still arriving past their deadline are only drawn
+                ### by the plot process if nothing fresher follows
+                deadlines = {}
+                for key in frames:
+                    budget = self.lag_budgets.get(key)
+                    if budget is not None and key not in self.streams:
+                        deadlines[key] = self.fetch_stamps.get(key, time.time()) + budget
+                if deadlines:
+                    frames["__deadlines__"] = deadlines
+        return snapshots
 
-    def new_liveplot_heatmap(self, data_func=None, kill_func=None, **plot_settings):
-        key = self.__new_plot_prep__(data_func, kill_func)
-        self.task_q.put(["new_heatmap", key, plot_settings])
+    def __share_data__(self, changed, stamps=None):
+        fallback = {}
+        for key, data in changed.items():
+            if isinstance(data, __StreamChunk__):
+                ### chunks must all arrive, the latest-wins rings would
+                ### drop them, so streams stay on data_q
+                fallback[key] = data
+                continue
+            try:
+                frame = np.asarray(data)
+            except ValueError:
+                frame = np.asarray(data, dtype=object)
+            if frame.dtype.hasobject or frame.ndim > MAX_DIMS:
+                ### ragged or object data cannot live in a flat buffer,
+                ### so it goes down the pickled queue path instead
+                if key in self.rings:
+                    self.rings.pop(key).close()
+                    shard = self.shard_of.get(key)
+                    if shard is not None:
+                        shard.task_q.put(["detach_shm", key, None])
+                fallback[key] = data
+                continue
+            ring = self.rings.get(key)
+            if ring is None or not ring.fits(frame):
+                ring = self.__new_ring__(key, frame)
+                if ring is None:
+                    continue
+            ring.write(frame, *(stamps[key] if stamps else (0., 0.)))
+        for shard, frames in self.__by_shard__(fallback, stamps).items():
+            ### never let the fallback keys stall the shared rings
+            self.__send__(shard, frames, wait=False)
+
+    def __new_ring__(self, key, frame):
+        ### runs outside data_cond, the window may have closed meanwhile
+        ### (its ring, if any, goes with the released keys)
+        shard = self.shard_of.get(key)
+        if shard is None:
+            return None
+        old = self.rings.get(key)
+        ring = __SharedRing__.create(frame, slots=self.shm_slots)
+        self.rings[key] = ring
+        shard.task_q.put(["attach_shm", key, ring.descriptor()])
+        if old is not None:
+            ### plot process keeps its own mapping of the old block
+            ### until the attach above swaps it out
+            old.close()
         if self.verbose:
-            print("command sent!")
+            print(f"New shared ring {ring.name} for key:{key}")
+        return ring
+
+    def start_recording(self, path, flush_interval=0.5):
+        """
+        Records every frame sent to the plot process (stream plots: every
+        chunk) into the directory `path`, appending if it already holds a
+        recording. Writes are batched every flush_interval seconds on a
+        background thread. Object or ragged data is not recorded.
+        """
+        self.stop_recording()
+        self.recorder = __Recorder__(path, flush_interval, verbose=self.verbose)
+        for key, (task, plot_settings) in self.plot_specs.items():
+            self.recorder.add_plot(key, task, plot_settings)
         return self
 
-    def new_liveplot_multi(self, data_func=None, kill_func=None, **plot_settings):
-        key = self.__new_plot_prep__(data_func, kill_func)
-        self.task_q.put(["new_multi_plot", key, plot_settings])
+    def stop_recording(self):
+        recorder, self.recorder = self.recorder, None
+        if recorder is not None:
+            recorder.close()
+        return self
+
+    def wait_ready(self, timeout=None):
+        """
+        Blocks until every window opened so far is up in its plot process,
+        returns False if that took longer than timeout seconds.
+        """
+        with self.ready_cond:
+            return self.ready_cond.wait_for(lambda: not self.opening, timeout)
+
+    def __open_window__(self, task, key, plot_settings):
+        for name in ("autoscale", "levels"):
+            ### fail here, not silently in the plot process
+            if name in plot_settings:
+                scale_policy(plot_settings[name])
+        self.plot_specs[key] = (task, plot_settings)
+        with self.ready_cond:
+            self.opening.add(key)
+        if self.recorder is not None:
+            self.recorder.add_plot(key, task, plot_settings)
+        if self.panels is not None:
+            ### part of a dashboard, new_dashboard opens them all at once
+            self.panels.append([task, key, plot_settings])
+            return self
+        self.__assign__(key, task, plot_settings).task_q.put([task, key, plot_settings])
         if self.verbose:
             print("command sent!")
         return self
 
-    def new_liveplot(self, data_func=None, kill_func=None, **plot_settings):
-        key = self.__new_plot_prep__(data_func, kill_func)
-        self.task_q.put(["new_live_plot", key, plot_settings])
-        # self.task_q.put(['dummy', key, plot_settings])
+    def __assign__(self, key, task, plot_settings, shard=None):
+        old = self.shard_of.get(key)
+        if old is not None:
+            old.loads.pop(key, None)
+        if shard is None:
+            shard = self.__pick_shard__()
+        if old is not None and old is not shard and key in self.rings:
+            ### reused key moved process, its ring lives on in the old one
+            self.rings.pop(key).close()
+            old.task_q.put(["detach_shm", key, None])
+        refresh = plot_settings.get("refresh_interval") or self.clock_interval * 5
+        shard.loads[key] = WINDOW_LOADS.get(task, 1) / refresh
+        if key in self.pooled:
+            self.__pool__().add(key, self.pooled[key][0], self.shards.index(shard))
+        with self.data_cond:
+            ### frames published before now were held back for this
+            self.shard_of[key] = shard
+            self.data_cond.notify()
+        if self.verbose and len(self.shards) > 1:
+            print(f"Key:{key} drawn by plot process {self.shards.index(shard)}")
+        return shard
+
+    def __pick_shard__(self):
+        if len(self.shards) == 1:
+            return self.shards[0]
+        if self.assign == "round_robin":
+            return self.shards[next(self.turns) % len(self.shards)]
+        return min(self.shards, key=__PlotShard__.load)
+
+    def stats(self):
+        """
+        Instrumentation snapshot (needs LivePlotAgent(instrument=True)).
+
+        Returns {"queue_depth", "sent", "bytes", "sent_per_s", "bytes_per_s",
+        "windows": {key: {...}}} where every window reports, when available,
+        published/coalesced frames and fetch_ms (data_func call time) from the
+        agent, and received/stale/rendered frames, rendered_per_s (achieved
+        fps), transit_ms (send to receive), render_ms (set_data time) and
+        latency_ms (fetch to rendered) from the plot process. Rates cover
+        the last second or so, bytes are raw array payload bytes.
+
+        "dropped" frames (overload policy, top level and per window) and
+        "late" ones the agent did not send (max_lag) are counted even without
+        instrument=True, late arrivals in the plot process only with it.
+        """
+        if self.stats_q is not None:
+            self.plot_stats = {}
+            for shard in self.shards:
+                while True:
+                    try:
+                        shard.plot_stats = shard.stats_q.get_nowait()
+                    except Empty:
+                        break
+                self.plot_stats.update(shard.plot_stats)
+        if self.pool is not None:
+            ### frames pool workers dropped on their way to data_q
+            for key, n in self.pool.dropped().items():
+                self.link_stats.count("dropped", n)
+                if key in self.shard_of:
+                    self.__key_stats__(key).count("dropped", n)
+        try:
+            queue_depth = sum(shard.data_q.qsize() for shard in self.shards)
+        except NotImplementedError:
+            queue_depth = None
+        windows = {}
+        for key in set(self.key_stats) | set(self.plot_stats):
+            windows[key] = self.__key_stats__(key).snapshot()
+            plot_stats = self.plot_stats.get(key, {})
+            ### both sides count late frames
+            late = windows[key].get("late", 0) + plot_stats.get("late", 0)
+            windows[key].update(plot_stats)
+            if late:
+                windows[key]["late"] = late
+        stats = {"queue_depth": queue_depth}
+        stats.update(self.link_stats.snapshot())
+        stats["windows"] = windows
+        return stats
+
+    def __check_states__(self, shard):
+        ### the plot process sends (key, True) once a window is up and
+        ### (key, False) once it has been closed and torn down, governed
+        ### ones also (key, "paused") and (key, "resumed")
+        while self.active:
+            try:
+                key, is_open = shard.state_q.get(timeout=0.5)
+            except Empty:
+                continue
+            except (EOFError, OSError):
+                return
+            if is_open == "paused":
+                self.paused.add(key)
+                if key in self.pooled:
+                    self.pool.pause(key, True)
+            elif is_open == "resumed":
+                self.paused.discard(key)
+                if key in self.pooled:
+                    self.pool.pause(key, False)
+            elif is_open:
+                self.states[key] = True
+                with self.ready_cond:
+                    self.opening.discard(key)
+                    self.ready_cond.notify_all()
+            else:
+                self._garbage_collection_(key)
+
+    def _garbage_collection_(self, key):
+        ### drop everything the agent holds for a closed window, the key
+        ### becomes available for the next new plot
         if self.verbose:
-            print("command sent!")
+            print(f"Cleaning data for key:{key}")
+        job = self.fetcher.remove(key)
+        if job is not None and job.kill_func:
+            job.kill_func()
+        pooled = self.pooled.pop(key, None)
+        if pooled is not None and self.pool is not None:
+            self.pool.remove(key)
+            if pooled[1]:
+                pooled[1]()
+        with self.data_cond:
+            self.states[key] = False
+            self.paused.discard(key)
+            self.dirty_keys.discard(key)
+            for store in (
+                self.data, self.streams, self.chunks, self.wire,
+                self.fetch_stamps, self.key_stats, self.plot_specs, self.lag_budgets,
+            ):
+                store.pop(key, None)
+            self.waterfalls.discard(key)
+            self.restarts.discard(key)
+            shard = self.shard_of.pop(key, None)
+            if shard is not None:
+                shard.loads.pop(key, None)
+            self.released.add(key)
+            if key not in self.available_window_keys:
+                self.available_window_keys.append(key)
+            self.data_cond.notify()
+
+    def __new_plot_prep__(
+        self,
+        data_func=None,
+        kill_func=None,
+        history=None,
+        poll_interval=None,
+        fetch_timeout=None,
+        waterfall=False,
+        wire_dtype=None,
+        compress=None,
+        max_lag=None,
+        pool=False,
+        transform=None,
+    ):
+        if compress is not None and compress not in CODECS:
+            raise ValueError(
+                f"Unknown compressor {compress}, available: {', '.join(CODECS)}"
+            )
+        if wire_dtype is not None:
+            wire_dtype = np.dtype(wire_dtype)
+            if wire_dtype.kind not in "fiu":
+                raise ValueError(f"wire_dtype must be a float or integer type, not {wire_dtype}")
+        wire = (wire_dtype, compress) if wire_dtype is not None or compress is not None else None
+        if not history and not data_func:
+            ### some dummy data if data func is None
+            data_func = __dummy_data__
+        pool_job = None
+        if pool or transform is not None:
+            pool_job = __FetchPool__.pack(
+                data_func if pool else None,
+                transform,
+                poll_interval or self.clock_interval,
+                history,
+                waterfall,
+                wire,
+                max_lag,
+            )
+
+        with self.data_cond:
+            if self.available_window_keys:
+                ### lowest key of a closed window, fully released by now
+                key = min(self.available_window_keys, key=int)
+                self.available_window_keys.remove(key)
+            else:
+                key = str(self.window_no)
+                self.window_no += 1
+            self.states[key] = True
+            ### late frames of the key's previous window are not ours
+            self.data.pop(key, None)
+            self.dirty_keys.discard(key)
+
+        if self.verbose:
+            print(f"Key: {key}")
+        self.last_key = key
+        if waterfall:
+            self.waterfalls.add(key)
+        else:
+            self.waterfalls.discard(key)
+        if wire is not None:
+            self.wire[key] = wire
+        else:
+            self.wire.pop(key, None)
+        if max_lag:
+            self.lag_budgets[key] = max_lag
+        else:
+            self.lag_budgets.pop(key, None)
+
+        if history:
+            self.streams[key] = history
+            self.chunks[key] = []
+        else:
+            self.streams.pop(key, None)
+        if pool_job is not None:
+            self.pooled[key] = (pool_job, kill_func if pool else None)
+        else:
+            self.pooled.pop(key, None)
+        if pool or not data_func:
+            ### fed through push() only, or fetched in the pool
+            return key
+
+        self.fetcher.add(
+            key,
+            data_func,
+            poll_interval or self.clock_interval,
+            timeout=fetch_timeout,
+            kill_func=kill_func,
+        )
+        return key
+
+
+    def new_liveplot_heatmap(
+        self,
+        data_func=None,
+        kill_func=None,
+        stream=False,
+        history=512,
+        poll_interval=None,
+        fetch_timeout=None,
+        wire_dtype=None,
+        compress=None,
+        max_lag=None,
+        pool=False,
+        transform=None,
+        **plot_settings,
+    ):
+        """
+        stream=True makes a scrolling waterfall of the last `history` rows:
+        data_func returns (or push() is given) only the new rows, (n, bins)
+        or (bins,), and the window scrolls them in from the right.
+
+        levels=(low, high) pins the colour levels, levels="auto" tracks the
+        data with level_decay, "grow" and "percentile" (level_percentile)
+        work as autoscale in new_liveplot (see __LiveHeatMap__). compress="zlib" (or
+        "lz4" when the lz4 package is installed) compresses frames on the
+        queue transport. wire_dtype, poll_interval, fetch_timeout, max_lag,
+        pool and transform work as in new_liveplot
+        """
+        key = self.__new_plot_prep__(
+            data_func,
+            kill_func,
+            history if stream else None,
+            poll_interval,
+            fetch_timeout,
+            waterfall=stream,
+            wire_dtype=wire_dtype,
+            compress=compress,
+            max_lag=max_lag,
+            pool=pool,
+            transform=transform,
+        )
+        if stream:
+            plot_settings.update(stream=True, history=history)
+        return self.__open_window__("new_heatmap", key, plot_settings)
+
+    def new_liveplot_multi(
+        self,
+        data_func=None,
+        kill_func=None,
+        stream=False,
+        history=1000,
+        poll_interval=None,
+        fetch_timeout=None,
+        wire_dtype=None,
+        max_lag=None,
+        pool=False,
+        transform=None,
+        **plot_settings,
+    ):
+        """
+        stream, poll_interval, fetch_timeout, wire_dtype, max_lag, pool,
+        transform and autoscale (every grid plot on its own) work as in
+        new_liveplot. For many channels, stacked=True draws them all in one
+        plot (spacing=None scales every channel into its own lane) and
+        page_size=n shows n channel plots at a time, see __LiveMultiWindow__
+        """
+        key = self.__new_plot_prep__(
+            data_func,
+            kill_func,
+            history if stream else None,
+            poll_interval,
+            fetch_timeout,
+            wire_dtype=wire_dtype,
+            max_lag=max_lag,
+            pool=pool,
+            transform=transform,
+        )
+        if stream:
+            plot_settings.update(stream=True, history=history)
+        return self.__open_window__("new_multi_plot", key, plot_settings)
+
+    def new_liveplot(
+        self,
+        data_func=None,
+        kill_func=None,
+        stream=False,
+        history=1000,
+        poll_interval=None,
+        fetch_timeout=None,
+        wire_dtype=None,
+        derived=None,
+        max_lag=None,
+        archive=False,
+        pool=False,
+        transform=None,
+        **plot_settings,
+    ):
+        """
+        stream=True makes a streaming plot: the window keeps the last `history`
+        samples per channel in a preallocated ring and only new samples are
+        sent. Feed it with agent.push(agent.last_key, chunk), or give a
+        data_func that returns the new chunk on every call.
+
+        data_func (plain or async def) is called every poll_interval seconds
+        (default clock) on the shared fetch pool. A call running longer than
+        fetch_timeout seconds is dropped and the plot backs off; async calls
+        are cancelled.
+
+        wire_dtype (e.g. "float32", or "int16" scaled per row) down converts
+        numeric frames in the agent before they are sent, the plot process
+        converts them back. The shm transport only applies float dtypes
+        (integer ones fall back to float32) since its frames are not pickled.
+
+        derived=[("rolling_mean", 100), ("rms", 50), ("fft", 4096)] overlays
+        series computed in the plot process from the frames it already gets,
+        a third entry picks one source channel (default all): rolling mean
+        and RMS envelope over a window of samples, magnitude spectrum of the
+        newest n samples (None for all) in a second plot below.
+
+        max_lag=seconds is the lag budget of the plot, applied to frames
+        going through data_q (stream chunks are never dropped). Its plot
+        process never gets more than queue_depth snapshots queued, whatever
+        the overload policy (newer frames wait in the agent, latest value
+        wins), and frames older than the budget by the time they could be
+        sent are dropped, counted as "late". This bounds how long a frame
+        waits for the plot process, not how long moving and drawing it
+        takes: a frame that still arrives late is counted too and only drawn
+        if nothing fresher follows.
+
+        archive=True (streaming plots against sample number only) keeps every
+        sample of the session in the plot process with a min/max pyramid
+        over it: the window follows the newest `history` samples, zooming or
+        panning shows any part of the whole session at the matching level
+        of detail. Memory grows by about 1.7x the samples received.
+
+        pool=True calls data_func in one of the agent's worker processes
+        (see pool_workers) instead of the fetch pool, so CPU heavy ones do
+        not share the agent's GIL, and the worker puts the frames straight
+        on the plot process' data_q. transform=f runs f on every data_func
+        result (or pushed chunk) in a worker process instead, data_func
+        itself stays in the agent unless pool=True too. Both must pickle
+        (dill: lambdas and closures do, open device handles do not).
+        Frames going through the pool skip the agent: they are not recorded,
+        never use shm rings and fetch_timeout does not apply.
+
+        autoscale="grow" (only widens), "decay" (widens at once, relaxes
+        inwards by scale_decay per frame), "percentile" (like decay, towards
+        the scale_percentile and 100 - scale_percentile of the data) or
+        (low, high) (fixed y range) make the window set its view itself from
+        bounds it keeps up to date chunk by chunk, instead of pyqtgraph
+        rescanning every trace on every frame ("auto", the default). The
+        view only moves when the bounds moved by more than 2% of the span,
+        panning or zooming stops it until "A" (auto range) is clicked.
+        """
+        if archive:
+            if not stream or plot_settings.get("xdata") is not None:
+                raise ValueError("archive needs stream=True and xdata=None")
+            plot_settings["archive"] = True
+        if derived:
+            ### fail here, not silently in the plot process
+            derived = [tuple(spec) for spec in derived]
+            for spec in derived:
+                __Derived__(spec)
+            plot_settings["derived"] = derived
+        key = self.__new_plot_prep__(
+            data_func,
+            kill_func,
+            (ARCHIVE_HISTORY if archive else history) if stream else None,
+            poll_interval,
+            fetch_timeout,
+            wire_dtype=wire_dtype,
+            max_lag=max_lag,
+            pool=pool,
+            transform=transform,
+        )
+        if stream:
+            plot_settings.update(stream=True, history=history)
+        # self.task_q.put(['dummy', key, plot_settings])
+        return self.__open_window__("new_live_plot", key, plot_settings)
+
+    def new_dashboard(self, panels, title="Live Dashboard", columns=None):
+        """
+        Opens a grid of plots in one window with a single command to the plot
+        process. panels is a list of dicts holding the keyword arguments of
+        new_liveplot, a "kind" entry of "multi" or "heatmap" takes those of
+        new_liveplot_multi or new_liveplot_heatmap instead. columns defaults
+        to a square grid, the panel keys end up in agent.last_keys.
+
+            agent.new_dashboard(
+                [dict(data_func=f, title=f"ch{i}", xlabel="t", ylabel="V",
+                      refresh_interval=0.05, no_plots=1, plot_labels=None)
+                 for i, f in enumerate(funcs)],
+                columns=8,
+            )
+        """
+        kinds = {
+            "line": self.new_liveplot,
+            "multi": self.new_liveplot_multi,
+            "heatmap": self.new_liveplot_heatmap,
+        }
+        self.panels = []
+        try:
+            for panel in panels:
+                panel = dict(panel)
+                kinds[panel.pop("kind", "line")](**panel)
+        finally:
+            ### panels prepared before a bad one still get their windows
+            opened, self.panels = self.panels, None
+            if opened:
+                shard = None
+                for task, key, plot_settings in opened:
+                    shard = self.__assign__(key, task, plot_settings, shard=shard)
+                shard.task_q.put(
+                    [
+                        "new_dashboard",
+                        None,
+                        {"title": title, "columns": columns, "panels": opened},
+                    ]
+                )
+            self.last_keys = [key for task, key, plot_settings in opened]
         return self
 
     def close(self):
         self.__exit__(None, None, None)
-        return
\ No newline at end of file
+        return
+class ReplayAgent(LivePlotAgent):
+    """
+    ReplayAgent plays a recording made with LivePlotAgent(record=...) back
+    through the same kind of windows, at `speed` times real time. Frames are
+    read from the memory mapped recording only as they come due.
+
+    seek(seconds) jumps anywhere in the recording (windows show the state at
+    that point, stream plots get up to `history` samples replayed, archived
+    ones start their archive over with them), pause(), resume() and
+    set_speed() control playback, position() and duration tell where it is.
+    loop=True starts over at the end. Other keyword arguments go to
+    LivePlotAgent (transport, clock, ...).
+    """
+
+    def __init__(self, path, speed=1., loop=False, paused=False, **agent_kwargs):
+        if speed <= 0:
+            raise ValueError(f"speed must be positive, not {speed}")
+        super().__init__(**agent_kwargs)
+        ### frames come from the recording, never from data_funcs, so the
+        ### scheduler stops before the windows add their placeholder jobs
+        self.fetcher.stop()
+        self.recording = __Recording__(path)
+        self.times, self.owners, self.numbers = self.recording.timeline()
+        self.start_time = float(self.times[0]) if len(self.times) else 0.
+        self.duration = float(self.times[-1]) - self.start_time if len(self.times) else 0.
+        self.speed = speed
+        self.loop = loop
+
+        openers = {
+            "new_live_plot": self.new_liveplot,
+            "new_multi_plot": self.new_liveplot_multi,
+            "new_heatmap": self.new_liveplot_heatmap,
+        }
+        ### every recorded window gets its own, also ones that reused the
+        ### key of a window closed before them
+        self.replay_keys = {}  ### recording id -> key of the replay window
+        for key, plot in self.recording.plots.items():
+            if key in self.recording.index:
+                openers[plot["task"]](**plot["settings"])
+                self.replay_keys[key] = self.last_key
+
+        self.play_cond = threading.Condition()
+        self.cursor = 0
+        self.origin = (time.time(), self.start_time)  ### (wall, recorded) time
+        self.paused_at = self.start_time if paused else None
+        threading.Thread(
+            target=self.__play__, daemon=True, name="Replay thread"
+        ).start()
+
+    def __now__(self):
+        ### recorded time playback has reached, caller holds play_cond
+        if self.paused_at is not None:
+            return self.paused_at
+        wall, recorded = self.origin
+        return recorded + (time.time() - wall) * self.speed
+
+    def position(self):
+        with self.play_cond:
+            return min(self.__now__() - self.start_time, self.duration)
+
+    def seek(self, seconds):
+        with self.play_cond:
+            recorded = self.start_time + min(max(seconds, 0.), self.duration)
+            if self.paused_at is not None:
+                self.paused_at = recorded
+            else:
+                self.origin = (time.time(), recorded)
+            self.cursor = int(np.searchsorted(self.times, recorded, side="right"))
+            self.__restore__(recorded)
+            self.play_cond.notify()
+        return self
+
+    def set_speed(self, speed):
+        if speed <= 0:
+            raise ValueError(f"speed must be positive, not {speed}")
+        with self.play_cond:
+            self.origin = (time.time(), self.__now__())
+            self.speed = speed
+            self.play_cond.notify()
+        return self
+
+    def pause(self):
+        with self.play_cond:
+            self.paused_at = self.__now__()
+        return self
+
+    def resume(self):
+        with self.play_cond:
+            if self.paused_at is not None:
+                self.origin = (time.time(), self.paused_at)
+                self.paused_at = None
+                self.play_cond.notify()
+        return self
+
+    def __restore__(self, recorded):
+        ### put every window back to what it showed at `recorded`
+        for key, index in self.recording.index.items():
+            replay_key = self.replay_keys[key]
+            n = int(np.searchsorted(index["time"], recorded, side="right"))
+            with self.data_cond:
+                stream = replay_key in self.streams
+                if stream:
+                    ### the window drops its ring (and archive) with the next
+                    ### chunk, unsent samples from before the seek go now
+                    self.chunks[replay_key] = []
+                    self.restarts.add(replay_key)
+            if n == 0:
+                continue
+            if not stream:
+                self.__deliver__(key, n - 1)
+                continue
+            ### what the window holds, archived plots stream every sample
+            history = self.recording.plots[key]["settings"]["history"]
+            first, samples = n, 0
+            while first > 0 and samples < history:
+                first -= 1
+                record = index[first]
+                samples += int(record["shape"][record["ndim"] - 1]) if record["ndim"] else 1
+            for i in range(first, n):
+                self.__deliver__(key, i)
+
+    def __deliver__(self, key, i):
+        replay_key = self.replay_keys[key]
+        frame = self.recording.frame(key, i)
+        if replay_key in self.streams:
+            self.__append__(replay_key, frame)
+        else:
+            self.__publish__(replay_key, frame)
+
+    def __play__(self):
+        while self.active:
+            with self.play_cond:
+                now = self.__now__()
+                while self.cursor < len(self.times) and self.times[self.cursor] <= now:
+                    self.__deliver__(self.owners[self.cursor], int(self.numbers[self.cursor]))
+                    self.cursor += 1
+                if self.cursor >= len(self.times) and self.loop and len(self.times):
+                    self.seek(0.)
+                    continue
+                if self.cursor >= len(self.times) or self.paused_at is not None:
+                    wait = 0.5
+                else:
+                    wait = min((self.times[self.cursor] - now) / self.speed, 0.5)
+                self.play_cond.wait(wait)
+
+def serve(address, **agent_kwargs):
+    """
+    Runs a plot process that only draws what PlotClient producers send to
+    `address`, until it exits or the caller is interrupted.
+
+        python liveplot.py --listen unix:/tmp/liveplot.sock --render-clock
+    """
+    agent = LivePlotAgent(listen=address, **agent_kwargs)
+    try:
+        while agent.process.is_alive():
+            agent.process.join(0.5)
+    except KeyboardInterrupt:
+        pass
+    agent.close()
+    return
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="liveplot socket plot server")
+    parser.add_argument("--listen", required=True,
+                        help="unix:/path or tcp:host:port to accept PlotClients on")
+    parser.add_argument("--clock", type=float, default=0.01)
+    parser.add_argument("--render-clock", action="store_true")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    serve(args.listen, clock=args.clock, render_clock=args.render_clock,
+          verbose=args.verbose)
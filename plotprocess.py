@@ -0,0 +1,497 @@
+#!/usr/bin/env python3
+
+import numpy as np
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import QTimer
+import time
+import threading
+
+from functools import partial
+from queue import Empty, SimpleQueue
+
+from windows import (
+    __LivePlotterWindow__, __LiveMultiWindow__, __LiveHeatMap__, __LiveDashboard__,
+)
+from worker import __RenderClock__, __RefreshGovernor__
+from stats import __FrameStats__
+from transport import __SharedRing__, __StreamChunk__, __PackedFrame__
+from plotsocket import __SocketServer__
+
+'''
+Plot process side of the liveplot data ecosystem
+
+Only the plot processes import this module (and with it PyQt5 and
+pyqtgraph), the agent process never does. __Qapp_liveplot__ builds the
+QApplication up front and then waits for a configure task, so a plot process
+can be started and warmed up before any agent takes it (see PlotServer).
+With a listen address it also serves producers of other processes over a
+local socket (see plotsocket).
+
+'''
+###################################################################################
+def __Qapp_liveplot__(task_q, state_q, data_q, stats_q):
+    app = QApplication([])
+    ### everything is imported and the app is up, now wait for the agent
+    ### that takes this process to say how to run it
+    task, _, settings = task_q.get()
+    if task != "configure":
+        return
+    try:
+        liveplot_instance = __LivePlotProcess__(
+            task_q,
+            state_q,
+            data_q,
+            settings["clock"],
+            app,
+            settings["verbose"],
+            settings["render_clock"],
+            stats_q if settings["instrument"] else None,
+            settings.get("listen"),
+            settings.get("render_budget"),
+        )
+    except Exception as e:
+        raise e
+    # return liveplot_instance
+###################################################################################
+class __LivePlotProcess__:
+    def __init__(
+        self,
+        task_q,
+        state_q,
+        data_q,
+        clock,
+        app,
+        verbose,
+        render_clock=False,
+        stats_q=None,
+        listen=None,
+        render_budget=None,
+    ):
+        self.app = app
+        self.verbose = verbose
+        self.windows = {}
+        self.window_no = 0
+        self.clock_interval = clock
+        self.task_q = task_q
+        self.state_q = state_q
+        self.data_q = data_q
+        self.isalive = True
+        self.retiring = set()  ### WorkerBees of closed windows still winding down
+        self.rings = {}
+        self.frames = {}
+        self.frames_lock = threading.Lock()
+        ### instrumentation is on when the agent hands us a stats queue
+        self.stats_q = stats_q
+        self.key_stats = {}
+        self.stats_time = time.time()
+        threading.Thread(
+            target=self.__demux_data__, daemon=True, name="Data demux thread"
+        ).start()
+        ### windows opened by socket producers, their keys never go back
+        ### to the agent through state_q
+        self.remote_tasks = SimpleQueue()
+        self.remote_keys = set()
+        self.socket_server = None
+        if listen is not None:
+            try:
+                self.socket_server = __SocketServer__(
+                    listen, self.remote_tasks, self.__store__, verbose
+                )
+            except (OSError, ValueError) as e:
+                ### the agent's own windows still work without producers
+                print(f"Plot process cannot listen on {listen}: {e}")
+        self.governor = None
+        if render_budget:
+            self.governor = __RefreshGovernor__(
+                render_budget, self.windows, self.__paused__
+            )
+        if render_clock:
+            self.render_clock = __RenderClock__(clock)
+            self.event_loop()
+        else:
+            self.render_clock = None
+            self.main_loop()
+
+    def main_loop(self):
+
+        while self.isalive:
+            self.__poll_tasks__()
+
+            ### every WorkerBee whose last frame was drawn may post one
+            ### more, slow windows must not keep processEvents from
+            ### returning to poll tasks
+            for window in list(self.windows.values()):
+                if window.worker.pending == "drawn":
+                    window.worker.pending = None
+
+            time.sleep(self.clock_interval)
+
+            self.app.processEvents()
+
+        if self.verbose:
+            print("Exiting LivePlotProcess")
+        self.__exit__(None, None, None)
+
+    def event_loop(self):
+        ### render clock mode: a real Qt event loop, tasks are polled by
+        ### a timer and windows are drawn by the shared RenderClock
+        self.task_timer = QTimer()
+        self.task_timer.timeout.connect(self.__poll_tasks__)
+        self.task_timer.start(max(int(self.clock_interval * 1000), 1))
+        ### only a break task ends the process, not closing its last window
+        self.app.setQuitOnLastWindowClosed(False)
+        self.app.exec_()
+
+        if self.verbose:
+            print("Exiting LivePlotProcess")
+        self.task_timer.stop()
+        self.render_clock.stop()
+        self.__exit__(None, None, None)
+
+    def __poll_tasks__(self):
+        if self.stats_q is not None and time.time() - self.stats_time > 1:
+            self.stats_time = time.time()
+            ### only the newest snapshot matters, replace an unread one
+            try:
+                self.stats_q.get_nowait()
+            except Empty:
+                pass
+            self.stats_q.put(
+                {key: stats.snapshot() for key, stats in self.key_stats.items()}
+            )
+
+        if self.governor is not None:
+            self.governor.poll()
+
+        ### drain everything queued since the last tick, a burst of new
+        ### windows must not trickle in one per clock
+        while self.isalive:
+            try:
+                new_task = self.task_q.get_nowait()
+            except Empty:
+                break
+            self.__handle_task__(new_task)
+        while self.isalive:
+            try:
+                new_task = self.remote_tasks.get_nowait()
+            except Empty:
+                break
+            self.__handle_remote__(new_task)
+        return self
+
+    def __handle_remote__(self, new_task):
+        ### settings come from another program, a bad one must not take
+        ### the process (and every other window in it) down
+        key = new_task[1]
+        try:
+            if new_task[0] == "close_window":
+                window = self.windows.get(key)
+                if window is not None:
+                    window.window.close()
+            elif key not in self.windows:
+                self.remote_keys.add(key)
+                self.__handle_task__(new_task)
+        except Exception as e:
+            self.remote_keys.discard(key)
+            if self.socket_server is not None:
+                self.socket_server.forget(key)
+            if self.verbose:
+                print(f"Socket plot {key} failed: {e!r}")
+        return self
+
+    def __handle_task__(self, new_task):
+        if new_task[0] == "new_live_plot":
+            ### task[1] should be window identifier key (any str)
+            ### task[2] should be plotter kwargs
+            if self.verbose:
+                print("command received!!")
+                print(new_task)
+            self.new_window(new_task[1], **new_task[2])
+
+        elif new_task[0] == "new_multi_plot":
+            if self.verbose:
+                print("command received!!")
+                print(new_task)
+            self.new_multiwindow(new_task[1], **new_task[2])
+
+        elif new_task[0] == "new_heatmap":
+            if self.verbose:
+                print("command received!!")
+                print(new_task)
+            self.new_liveplot_heatmap(new_task[1], **new_task[2])
+
+        elif new_task[0] == "new_dashboard":
+            ### task[2] holds the dashboard title, columns and its
+            ### [task, key, plotter kwargs] panels
+            if self.verbose:
+                print("command received!!")
+                print(new_task)
+            self.new_dashboard(**new_task[2])
+
+        elif new_task[0] == "attach_shm":
+            ### task[2] should be the shared ring descriptor
+            self.attach_ring(new_task[1], *new_task[2])
+
+        elif new_task[0] == "detach_shm":
+            self.detach_ring(new_task[1])
+
+        elif new_task[0] == "break":
+            self.isalive = False
+            if self.render_clock is not None:
+                self.app.quit()
+            if self.verbose:
+                print("stopping process loop")
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for key in list(self.rings):
+            self.detach_ring(key)
+        if self.socket_server is not None:
+            self.socket_server.close()
+        if self.verbose:
+            print("LivePlotProcess exiting ciao bella ciao")
+        return
+
+    def attach_ring(self, key, name, dtype, slots, capacity):
+        try:
+            ring = __SharedRing__.attach(name, dtype, slots, capacity)
+        except FileNotFoundError:
+            ### agent already replaced this ring, a newer attach is queued
+            if self.verbose:
+                print(f"Shared ring {name} gone before attaching, skipping")
+            return self
+        old = self.rings.get(str(key))
+        self.rings[str(key)] = ring
+        if old is not None:
+            old.close()
+        if self.verbose:
+            print(f"Attached shared ring {name} for key:{key}")
+        return self
+
+    def detach_ring(self, key):
+        ring = self.rings.pop(str(key), None)
+        if ring is not None:
+            ring.close()
+        return self
+
+    def __demux_data__(self):
+        ### single reader for data_q, keeps only the newest frame per key so
+        ### every window sees the latest data instead of stealing snapshots
+        ### from each other, streaming chunks accumulate until consumed
+        late = {}  ### key -> (frame, stamp) past its lag budget, held back
+        while self.isalive:
+            try:
+                snapshot = self.data_q.get(timeout=self.clock_interval)
+                stamps = snapshot.pop("__stamps__", None)
+                deadlines = snapshot.pop("__deadlines__", None)
+                for key in snapshot:
+                    ### superseded by a newer frame, never drawn
+                    late.pop(key, None)
+                if deadlines is not None:
+                    now = time.time()
+                    for key, deadline in deadlines.items():
+                        if now > deadline and key in snapshot:
+                            ### over the plot's lag budget, only worth drawing
+                            ### if nothing fresher follows it
+                            late[key] = (
+                                snapshot.pop(key),
+                                None if stamps is None else stamps[key],
+                            )
+                            if stamps is not None:
+                                self.__key_stats__(key).count("late")
+                self.__store__(snapshot, stamps)
+            except Empty:
+                pass
+            except Exception as e:
+                if self.verbose:
+                    print(e)
+            if late and self.data_q.empty():
+                ### nothing newer pending, the window would freeze otherwise
+                for key, (frame, stamp) in late.items():
+                    self.__store__({key: frame}, None if stamp is None else {key: stamp})
+                late.clear()
+        if self.verbose:
+            print("demux thread exiting")
+        return
+
+    def __store__(self, snapshot, stamps=None):
+        ### latest wins per key, called by the demux and the socket threads
+        with self.frames_lock:
+            for key, payload in snapshot.items():
+                payload = self.__unpack__(payload)
+                pending = self.frames.get(key)
+                if isinstance(payload, __StreamChunk__) and isinstance(
+                    pending, __StreamChunk__
+                ):
+                    payload = pending.merge(payload)
+                elif stamps is not None and pending is not None:
+                    ### replaced before its window ever drew it
+                    self.__key_stats__(key).count("stale")
+                self.frames[key] = payload
+                if stamps is not None:
+                    self.__key_stats__(key).received(*stamps[key])
+        return self
+
+    def __unpack__(self, payload):
+        ### rebuild frames the agent packed for the wire (see wire_dtype)
+        if isinstance(payload, __PackedFrame__):
+            return payload.unpack()
+        if isinstance(payload, __StreamChunk__) and isinstance(
+            payload.data, __PackedFrame__
+        ):
+            payload.data = payload.data.unpack()
+        return payload
+
+    def __internal_data_func__(self, key):
+        ring = self.rings.get(str(key))
+        if ring is not None:
+            ### zero copy view of the newest frame, empty if nothing new
+            frame = ring.read()
+            if frame is None:
+                return np.array([])
+            if self.stats_q is not None:
+                stats = self.__key_stats__(key).received(*ring.last_stamps)
+                if ring.skipped:
+                    stats.count("stale", ring.skipped)
+            return frame
+        ### newest frame for this key, empty if nothing new since last call
+        with self.frames_lock:
+            frame = self.frames.pop(str(key), None)
+        if frame is None:
+            return np.array([])
+        if isinstance(frame, __StreamChunk__):
+            if frame.restart:
+                ### no earlier chunk is still on its way to the window
+                ### (WorkerBee.pending, or the RenderClock's own update)
+                window = self.windows.get(str(key))
+                if window is not None:
+                    window.restarting = True
+            return frame.data
+        return frame
+
+    def __key_stats__(self, key):
+        stats = self.key_stats.get(str(key))
+        if stats is None:
+            stats = self.key_stats[str(key)] = __FrameStats__()
+        return stats
+
+    def __register__(self, key):
+        window = self.windows[str(key)]
+        ### frames stored before the window existed are its own (pushes
+        ### straight after opening), a reused key's old ones went with
+        ### __window_closed__ and the agent's reuse of the key
+        if self.stats_q is not None:
+            window.frame_stats = self.__key_stats__(key)
+        if self.render_clock is not None:
+            self.render_clock.add(key, window)
+        window.sigClosed.connect(partial(self.__window_closed__, str(key)))
+        if str(key) not in self.remote_keys:
+            self.state_q.put((str(key), True))
+        return self
+
+    def __window_closed__(self, key):
+        ### tear everything of a closed window down right away and tell the
+        ### agent, so long sessions do not pile up threads, widgets or rings
+        window = self.windows.pop(key, None)
+        if window is None:
+            return self
+        if self.render_clock is not None:
+            self.render_clock.remove(key)
+        self.detach_ring(key)
+        with self.frames_lock:
+            self.frames.pop(key, None)
+        self.key_stats.pop(key, None)
+        worker = window.release()
+        if worker is not None:
+            self.retiring.add(worker)
+            worker.finished.connect(partial(self.retiring.discard, worker))
+        if key in self.remote_keys:
+            self.remote_keys.discard(key)
+            self.socket_server.forget(key)
+        else:
+            self.state_q.put((key, False))
+        if self.verbose:
+            print(f"Window for key:{key} closed and released")
+        return self
+
+    def __paused__(self, key, paused):
+        ### lets the agent stop fetching for windows nobody can see
+        if key not in self.remote_keys:
+            self.state_q.put((key, "paused" if paused else "resumed"))
+        return self
+
+    def new_dashboard(self, title, columns, panels):
+        dashboard = __LiveDashboard__(title, len(panels), columns)
+        openers = {
+            "new_live_plot": self.new_window,
+            "new_multi_plot": self.new_multiwindow,
+            "new_heatmap": self.new_liveplot_heatmap,
+        }
+        for i, (task, key, plot_kwargs) in enumerate(panels):
+            openers[task](key, canvas=dashboard.cell(i), **plot_kwargs)
+            ### every paint of the dashboard draws all of its panels
+            self.windows[str(key)].paint_share = 1. / len(panels)
+        return self
+
+    def new_window(self, key, **plot_kwargs):
+        ### we can pass a self function because it has no direct
+        ### link to the customer package which houses whatever
+        ### incompatible dll that cannot be pickled via Process
+        refresh_interval = plot_kwargs['refresh_interval']
+        if not refresh_interval:
+            plot_kwargs['refresh_interval'] = self.clock_interval * 5
+
+        if self.verbose:
+            print(f"Refreshing plot at {refresh_interval}s")
+
+        self.windows[str(key)] = __LivePlotterWindow__(
+            data_func = partial(self.__internal_data_func__, str(key)),
+            **plot_kwargs,
+            verbose = self.verbose,
+            scheduled = self.render_clock is not None,
+        )
+        self.__register__(key)
+        self.window_no += 1
+        return self
+    
+    def new_multiwindow(self, key, **plot_kwargs):
+        ### we can pass a self function because it has no direct
+        ### link to the customer package which houses whatever
+        ### incompatible dll that cannot be pickled via Process
+        refresh_interval = plot_kwargs['refresh_interval']
+        if not refresh_interval:
+            plot_kwargs['refresh_interval'] = self.clock_interval * 5
+
+        if self.verbose:
+            print(f"Refreshing plot at {refresh_interval}s")
+
+        self.windows[str(key)] = __LiveMultiWindow__(
+            data_func = partial(self.__internal_data_func__, str(key)),
+            **plot_kwargs,
+            verbose = self.verbose,
+            scheduled = self.render_clock is not None,
+        )
+        self.__register__(key)
+        self.window_no += 1
+        return self
+
+    def new_liveplot_heatmap(self, key, **plot_kwargs):
+        refresh_interval = plot_kwargs['refresh_interval']
+        if not refresh_interval:
+            plot_kwargs['refresh_interval'] = self.clock_interval * 5
+
+        if self.verbose:
+            print(f"Refreshing plot at {refresh_interval}s")
+
+        self.windows[str(key)] = __LiveHeatMap__(
+            data_func = partial(self.__internal_data_func__, str(key)),
+            **plot_kwargs,
+            verbose = self.verbose,
+            scheduled = self.render_clock is not None,
+        )
+        self.__register__(key)
+        self.window_no += 1
+        return self
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+
+import ipaddress
+import json
+import os
+import socket
+import stat
+import struct
+import sys
+import threading
+
+import numpy as np
+
+from transport import __StreamChunk__
+
+'''
+Local socket front door of a plot process
+
+A plot process started with LivePlotAgent(listen=address) also accepts
+producers from other processes on a Unix domain socket ("unix:/path") or a
+loopback TCP socket ("tcp:127.0.0.1:5555"), so several acquisition processes
+can share one GUI process. PlotClient is the producer side and only needs
+numpy.
+
+Every message is a fixed header (message type, JSON length), a small JSON
+header and, for frames, the raw array buffers back to back. Nothing is
+pickled, each array is read with recv_into straight into its own buffer and
+viewed in place with np.frombuffer.
+
+    OPEN    {"task", "key", "settings", "history"}
+    FRAMES  {"frames": [{"key", "dtype", "shape"}, ...]} + one buffer each
+    CLOSE   {"key"}
+
+'''
+
+OPEN, FRAMES, CLOSE = 1, 2, 3
+HEADER = struct.Struct("<BI")
+TASKS = {"line": "new_live_plot", "multi": "new_multi_plot", "heatmap": "new_heatmap"}
+
+def parse_address(address):
+    """
+    Returns (socket family, address) for "unix:/path", "tcp:host:port" or a
+    (host, port) tuple. TCP hosts must be loopback, plot processes take
+    producers of this machine only.
+    """
+    if isinstance(address, tuple):
+        host, port = address
+    else:
+        scheme, _, rest = str(address).partition(":")
+        if scheme == "unix" and rest:
+            return socket.AF_UNIX, rest
+        if scheme != "tcp" or not rest:
+            raise ValueError(f"Unknown address {address}, use unix:/path or tcp:host:port")
+        host, _, port = rest.rpartition(":")
+        host = host or "127.0.0.1"
+    try:
+        loopback = host == "localhost" or ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        loopback = False
+    if not loopback:
+        raise ValueError(f"TCP host {host} is not a loopback address, use 127.0.0.1")
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    return family, (host, int(port))
+
+def __recv_exactly__(sock, n):
+    buffer = bytearray(n)
+    view = memoryview(buffer)
+    got = 0
+    while got < n:
+        read = sock.recv_into(view[got:], n - got)
+        if not read:
+            raise ConnectionError("producer went away")
+        got += read
+    return buffer
+
+def __json_default__(obj):
+    ### numpy values in plot settings (levels, xdata, ...)
+    if isinstance(obj, (np.ndarray, np.generic)):
+        return obj.tolist()
+    raise TypeError(f"{type(obj).__name__} cannot be sent as a plot setting")
+
+def __send_message__(sock, kind, header, buffers=()):
+    header = json.dumps(header, default=__json_default__).encode()
+    sock.sendall(HEADER.pack(kind, len(header)) + header)
+    for buffer in buffers:
+        sock.sendall(buffer)
+
+def __remove_stale__(path):
+    ### only a socket nobody listens on any more (left behind by a plot
+    ### process that did not exit cleanly) may go, never a file or a live one
+    if not stat.S_ISSOCK(os.lstat(path).st_mode):
+        raise FileExistsError(f"{path} exists and is not a socket")
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except ConnectionRefusedError:
+        os.unlink(path)
+        return
+    finally:
+        probe.close()
+    raise OSError(f"Another plot process is listening on {path}")
+
+class __SocketServer__:
+    """
+    SocketServer runs in the plot process on threads of its own, one
+    accepting producers and one per producer decoding its messages. Window
+    tasks ([task, key, settings], as sent by the agent, plus close_window)
+    are put on `tasks` for the GUI thread, frames of opened keys go straight
+    to deliver(frames) just like the data_q demux.
+    """
+
+    def __init__(self, address, tasks, deliver, verbose=False):
+        family, self.address = parse_address(address)
+        self.family = family
+        if family == socket.AF_UNIX and os.path.lexists(self.address):
+            __remove_stale__(self.address)
+        self.listener = socket.socket(family, socket.SOCK_STREAM)
+        if family != socket.AF_UNIX:
+            self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(self.address)
+        self.listener.listen()
+        self.tasks = tasks
+        self.deliver = deliver
+        self.verbose = verbose
+        self.histories = {}  ### opened keys, history of stream plots else None
+        self.active = True
+        threading.Thread(
+            target=self.__accept__, daemon=True, name="Socket accept thread"
+        ).start()
+        if self.verbose:
+            print(f"Plot process listening on {address}")
+
+    def forget(self, key):
+        ### window gone, frames for it are dropped until it is opened again
+        self.histories.pop(key, None)
+        return self
+
+    def close(self):
+        self.active = False
+        self.listener.close()
+        if self.family == socket.AF_UNIX and os.path.exists(self.address):
+            os.unlink(self.address)
+        return self
+
+    def __accept__(self):
+        while self.active:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return
+            threading.Thread(
+                target=self.__serve__,
+                args=(conn,),
+                daemon=True,
+                name="Socket producer thread",
+            ).start()
+
+    def __serve__(self, conn):
+        with conn:
+            try:
+                while self.active:
+                    kind, length = HEADER.unpack(__recv_exactly__(conn, HEADER.size))
+                    header = json.loads(__recv_exactly__(conn, length))
+                    if kind == FRAMES:
+                        self.__frames__(conn, header["frames"])
+                    elif kind == OPEN:
+                        self.__open__(header)
+                    elif kind == CLOSE:
+                        self.tasks.put(["close_window", "remote:" + header["key"], None])
+                    else:
+                        raise ValueError(f"Unknown message type {kind}")
+            except (ConnectionError, OSError, ValueError, KeyError) as e:
+                if self.verbose and self.active:
+                    print(f"Producer disconnected: {e}")
+
+    def __open__(self, header):
+        if header["task"] not in TASKS.values():
+            ### producers only ever open windows, never drive the process
+            raise ValueError(f"Producers cannot send task {header['task']!r}")
+        key = "remote:" + header["key"]
+        settings = header["settings"]
+        if isinstance(settings.get("xdata"), list):
+            settings["xdata"] = np.asarray(settings["xdata"])
+        self.histories[key] = header.get("history")
+        self.tasks.put([header["task"], key, settings])
+        return self
+
+    def __frames__(self, conn, specs):
+        frames = {}
+        for spec in specs:
+            dtype = np.dtype(spec["dtype"])
+            if dtype.hasobject:
+                raise ValueError("object arrays cannot be sent")
+            shape = tuple(spec["shape"])
+            nbytes = dtype.itemsize * int(np.prod(shape))
+            ### every frame keeps a buffer of its own, windows hold on to it
+            data = np.frombuffer(__recv_exactly__(conn, nbytes), dtype=dtype).reshape(shape)
+            key = "remote:" + spec["key"]
+            if key not in self.histories:
+                continue
+            history = self.histories[key]
+            frames[key] = data if history is None else __StreamChunk__(data, history)
+        if frames:
+            self.deliver(frames)
+        return self
+
+class PlotClient:
+    """
+    PlotClient feeds the plot process of a LivePlotAgent(listen=address)
+    from any other process. Keys are names picked by the producers, every
+    connected producer can open plots and send frames to any key.
+
+        client = PlotClient("unix:/tmp/liveplot.sock")
+        client.new_liveplot("rig1/temp", title="T", xlabel="t", ylabel="K",
+                            refresh_interval=0.05, no_plots=1, plot_labels=None)
+        client.send("rig1/temp", frame)
+        client.send_many({"rig1/temp": frame, "rig1/camera": image})
+
+    Plot settings work as on the agent's new_liveplot* but must be JSON
+    (numpy arrays are sent as lists). Frames for keys whose window is closed
+    are dropped until the key is opened again.
+    """
+
+    def __init__(self, address, timeout=None):
+        family, address = parse_address(address)
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(address)
+        if family != socket.AF_UNIX:
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.lock = threading.Lock()
+        self.waterfalls = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __open__(self, kind, key, stream, history, plot_settings):
+        if stream:
+            plot_settings.update(stream=True, history=history)
+        header = {
+            "task": TASKS[kind],
+            "key": str(key),
+            "settings": plot_settings,
+            ### archived plots keep every sample, never trim their chunks
+            "history": (sys.maxsize if plot_settings.get("archive") else history)
+            if stream
+            else None,
+        }
+        with self.lock:
+            __send_message__(self.sock, OPEN, header)
+        return self
+
+    def new_liveplot(self, key, stream=False, history=1000, **plot_settings):
+        return self.__open__("line", key, stream, history, plot_settings)
+
+    def new_liveplot_multi(self, key, stream=False, history=1000, **plot_settings):
+        return self.__open__("multi", key, stream, history, plot_settings)
+
+    def new_liveplot_heatmap(self, key, stream=False, history=512, **plot_settings):
+        if stream:
+            self.waterfalls.add(str(key))
+        else:
+            self.waterfalls.discard(str(key))
+        return self.__open__("heatmap", key, stream, history, plot_settings)
+
+    def send(self, key, data):
+        return self.send_many({key: data})
+
+    def push(self, key, chunk):
+        """
+        New samples for a plot opened with stream=True, as agent.push.
+        """
+        chunk = np.atleast_2d(chunk)
+        if str(key) in self.waterfalls:
+            ### rows -> columns, the window ring runs over the last axis
+            chunk = chunk.T
+        return self.send_many({key: chunk})
+
+    def send_many(self, frames):
+        """
+        Sends frames of several keys as one message, {key: array}.
+        """
+        specs, buffers = [], []
+        for key, data in frames.items():
+            data = np.ascontiguousarray(data)
+            if data.dtype.hasobject:
+                raise TypeError(f"Frame for key {key} is an object array")
+            specs.append({"key": str(key), "dtype": data.dtype.str, "shape": data.shape})
+            buffers.append(memoryview(data.reshape(-1)).cast("B"))
+        with self.lock:
+            __send_message__(self.sock, FRAMES, {"frames": specs}, buffers)
+        return self
+
+    def close_plot(self, key):
+        with self.lock:
+            __send_message__(self.sock, CLOSE, {"key": str(key)})
+        return self
+
+    def close(self):
+        self.sock.close()
+        return
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+
+import warnings
+from collections import deque
+
+import numpy as np
+
+'''
+Vectorised numpy helpers run on the plot process side before data reaches
+pyqtgraph
+
+minmax_decimate reduces a trace to a min/max envelope of about two points per
+horizontal pixel over the visible x range, so spikes and glitches stay
+visible however many samples the trace holds, a (channels, n) block sharing
+one x axis is decimated in one pass
+
+Derived evaluates the declarative derived channels of a line window (rolling
+mean, rolling RMS envelope, FFT magnitude) on the frames the plot process
+already received, so they never cost any transport. Rolling series of
+streaming windows are updated incrementally from every new chunk.
+
+Bounds tracks the value range a window shows under an autoscale policy from
+chunk-wise min/max (streams) or the decimated frame, so windows can set
+their view themselves instead of pyqtgraph rescanning every trace for its
+bounds on every frame, and only move it when the bounds moved noticeably.
+
+'''
+
+DERIVED = ("rolling_mean", "rms", "fft")
+SCALE_POLICIES = ("auto", "fixed", "grow", "decay", "percentile")
+
+def scale_policy(spec):
+    """
+    Returns (policy, limits) of an autoscale spec: one of SCALE_POLICIES or
+    (low, high), which is "fixed" at those limits.
+    """
+    if isinstance(spec, str):
+        if spec not in SCALE_POLICIES or spec == "fixed":
+            raise ValueError(
+                f"Unknown autoscale policy {spec}, use (low, high) or one of "
+                f"{', '.join(p for p in SCALE_POLICIES if p != 'fixed')}"
+            )
+        return spec, None
+    try:
+        low, high = (float(v) for v in spec)
+    except (TypeError, ValueError):
+        raise ValueError(f"Autoscale limits must be (low, high), not {spec!r}")
+    return "fixed", (low, high)
+
+def minmax_decimate(y, bins, x=None, lo=None, hi=None):
+    """
+    Returns (x, y) of the min/max envelope of y between x positions lo and
+    hi (whole trace if None), two points per bin. x defaults to the sample
+    index and must be monotonic if given. Traces that already fit into
+    2 * bins points come back as plain slices. y may be a (channels, n)
+    block, every row gets the same bins and the x returned fits all of them.
+    """
+    n = y.shape[-1]
+    if x is None:
+        start = 0 if lo is None else int(np.floor(lo))
+        stop = n if hi is None else int(np.ceil(hi)) + 1
+    else:
+        start = 0 if lo is None else int(np.searchsorted(x, lo, side="right"))
+        stop = n if hi is None else int(np.searchsorted(x, hi, side="left")) + 1
+    ### one sample of margin either side so lines reach the view edges
+    start = min(max(start - 1, 0), n)
+    stop = min(max(stop + 1, start), n)
+
+    size = (stop - start) // max(bins, 1)
+    if size < 2:
+        xs = np.arange(start, stop) if x is None else x[start:stop]
+        return xs, y[..., start:stop]
+
+    body_stop = start + size * bins
+    body = y[..., start:body_stop].reshape(y.shape[:-1] + (bins, size))
+    mins = body.min(axis=-1)
+    maxs = body.max(axis=-1)
+    starts = np.arange(start, body_stop, size)
+    if body_stop < stop:
+        ### leftover samples that did not fill a whole bin
+        tail = y[..., body_stop:stop]
+        mins = np.concatenate([mins, tail.min(axis=-1, keepdims=True)], axis=-1)
+        maxs = np.concatenate([maxs, tail.max(axis=-1, keepdims=True)], axis=-1)
+        starts = np.append(starts, body_stop)
+
+    envelope = np.empty(mins.shape[:-1] + (2 * mins.shape[-1],), dtype=y.dtype)
+    envelope[..., 0::2] = mins
+    envelope[..., 1::2] = maxs
+    xs = starts if x is None else x[starts]
+    return np.repeat(xs, 2), envelope
+
+def rolling_mean(y, window):
+    """
+    Trailing mean over the last `window` samples along the last axis, the
+    first window - 1 samples average over whatever came before them.
+    Returns float64 of the same shape as y.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n = y.shape[-1]
+    sums = np.cumsum(y, axis=-1)
+    if n > window:
+        sums[..., window:] -= sums[..., :-window].copy()
+    return sums / np.minimum(np.arange(1, n + 1), window)
+
+def rolling_rms(y, window):
+    """
+    Trailing RMS envelope over the last `window` samples, see rolling_mean.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    ### cumsum differences can dip a hair below zero
+    return np.sqrt(np.maximum(rolling_mean(y * y, window), 0))
+
+def fft_magnitude(y, n=None, spacing=1.):
+    """
+    Returns (frequencies, amplitudes) of the single sided magnitude spectrum
+    of the newest n samples (all if None) along the last axis, for samples
+    `spacing` x units apart.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    if n:
+        y = y[..., -n:]
+    n = y.shape[-1]
+    amplitudes = np.abs(np.fft.rfft(y, axis=-1)) * (2 / max(n, 1))
+    return np.fft.rfftfreq(n, spacing), amplitudes
+
+class __Derived__:
+    """
+    Derived is one derived series spec of a line window, (name, param) or
+    (name, param, channel): ("rolling_mean", window), ("rms", window) or
+    ("fft", n). channel picks one source channel, default every channel.
+
+    frame(channels) evaluates a whole frame. extend(chunk) feeds a stream:
+    rolling series only look at the chunk plus the window - 1 samples
+    carried over from the previous one and return the derived samples of
+    the chunk.
+    """
+
+    def __init__(self, spec):
+        spec = tuple(spec)
+        self.name = spec[0]
+        if self.name not in DERIVED:
+            raise ValueError(
+                f"Unknown derived channel {self.name}, available: {', '.join(DERIVED)}"
+            )
+        self.param = spec[1] if len(spec) > 1 else None
+        self.channel = spec[2] if len(spec) > 2 else None
+        if self.name != "fft" and not (self.param and self.param > 0):
+            raise ValueError(f"Derived channel {self.name} needs a window size")
+        self.spectral = self.name == "fft"
+        self.tail = None
+
+    def label(self, channel_name):
+        param = "" if self.param is None else f" {self.param}"
+        return f"{self.name}{param} {channel_name}"
+
+    def sources(self, channels):
+        ### source channel indices out of a frame holding `channels` rows
+        if self.channel is None:
+            return list(range(channels))
+        return [self.channel] if self.channel < channels else []
+
+    def select(self, channels):
+        if self.channel is None:
+            return channels
+        return channels[self.channel : self.channel + 1]
+
+    def rolling(self, y):
+        if self.name == "rms":
+            return rolling_rms(y, self.param)
+        return rolling_mean(y, self.param)
+
+    def frame(self, channels, spacing=1.):
+        """
+        Returns (x, values) for spectra, else the (sources, n) values.
+        """
+        block = self.select(np.atleast_2d(channels))
+        if self.spectral:
+            return fft_magnitude(block, self.param, spacing)
+        return self.rolling(block)
+
+    def extend(self, chunk):
+        block = self.select(np.atleast_2d(chunk)).astype(np.float64)
+        if self.tail is not None and self.tail.shape[0] == block.shape[0]:
+            ### warm up: fewer carried samples than window - 1 means that is
+            ### everything seen so far, so partial windows stay right
+            block = np.concatenate([self.tail, block], axis=-1)
+            start = self.tail.shape[-1]
+        else:
+            start = 0
+        values = self.rolling(block)[..., start:]
+        self.tail = block[..., max(block.shape[-1] - (self.param - 1), 0) :]
+        return values
+
+    def reset(self):
+        self.tail = None
+        return self
+
+class __Bounds__:
+    """
+    Bounds is the (low, high) a window shows for one autoscale policy:
+    "fixed" stays at limits, "grow" only ever widens, "decay" widens at once
+    and relaxes inwards by `decay` per frame towards the bounds of the data
+    in view, "percentile" does the same towards the percentile and
+    100 - percentile of a sample of it (outliers do not stretch the view).
+
+    Streams feed chunk(new samples): only the new samples are scanned and
+    the min/max of the chunks covering the last `window` samples make the
+    bounds of the data in view. frame(data) replaces all of it at once,
+    windows hand it their decimated envelope, which keeps every extreme.
+    settle() applies one frame's step and returns True when the shown
+    bounds moved by more than `threshold` of their span.
+    """
+
+    def __init__(self, policy="decay", limits=None, decay=0.05, percentile=1.,
+                 window=None, threshold=0.02):
+        self.policy = policy
+        self.decay = decay
+        self.percentile = percentile
+        self.window = window
+        self.threshold = threshold
+        self.chunks = deque()  ### (min, max, samples) of the data in view
+        self.count = 0
+        self.tracked = None
+        self.shown = tuple(limits) if policy == "fixed" else None
+
+    @property
+    def empty(self):
+        return not self.chunks
+
+    def reset(self):
+        ### forget the data, the shown bounds stay until the next settle
+        self.chunks.clear()
+        self.count = 0
+        self.tracked = None
+        return self
+
+    def chunk(self, *blocks):
+        """
+        New samples along the last axis, several blocks (the traces of one
+        plot) make one chunk.
+        """
+        if self.policy == "fixed":
+            return self
+        low, high, n = np.nan, np.nan, 0
+        for block in blocks:
+            block = np.asarray(block)
+            if not block.size:
+                continue
+            ### fmin/fmax skip NaN, all NaN comes out NaN and is ignored
+            low = np.fmin(low, np.fmin.reduce(block, axis=None))
+            high = np.fmax(high, np.fmax.reduce(block, axis=None))
+            n = max(n, block.shape[-1] if block.ndim else 1)
+        if not n:
+            return self
+        self.chunks.append((float(low), float(high), n))
+        self.count += n
+        while (
+            self.window
+            and len(self.chunks) > 1
+            and self.count - self.chunks[0][2] >= self.window
+        ):
+            self.count -= self.chunks.popleft()[2]
+        return self
+
+    def frame(self, *blocks):
+        self.chunks.clear()
+        self.count = 0
+        return self.chunk(*blocks)
+
+    def target(self, sample=None):
+        if self.policy == "percentile" and sample is not None:
+            with warnings.catch_warnings():
+                ### all NaN sample
+                warnings.simplefilter("ignore", RuntimeWarning)
+                low, high = np.nanpercentile(sample, (self.percentile, 100 - self.percentile))
+            return float(low), float(high)
+        lows = [c[0] for c in self.chunks if c[0] == c[0]]
+        highs = [c[1] for c in self.chunks if c[1] == c[1]]
+        if not lows:
+            return None
+        return min(lows), max(highs)
+
+    def settle(self, sample=None):
+        """
+        sample is a (strided) sample of the data in view, only "percentile"
+        needs it.
+        """
+        if self.policy == "fixed":
+            return False
+        target = self.target(sample)
+        if target is None or not all(np.isfinite(target)):
+            return False
+        low, high = target
+        if self.tracked is None:
+            self.tracked = target
+        elif self.policy == "grow":
+            self.tracked = (min(low, self.tracked[0]), max(high, self.tracked[1]))
+        else:
+            old_low, old_high = self.tracked
+            self.tracked = (
+                low if low < old_low else old_low + self.decay * (low - old_low),
+                high if high > old_high else old_high + self.decay * (high - old_high),
+            )
+        if self.shown is not None:
+            span = max(self.shown[1] - self.shown[0], 1e-12)
+            moved = max(abs(a - b) for a, b in zip(self.tracked, self.shown))
+            if moved < self.threshold * span:
+                return False
+        self.shown = self.tracked
+        return True
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import threading
+
+import numpy as np
+
+from transport import __StreamChunk__, MAX_DIMS
+
+'''
+Record and replay of live plotting sessions
+
+A recording is a directory holding, per opened window, an append only blob
+of raw frame bytes (<id>.bin) and an append only index of fixed size records
+(<id>.idx) pointing into it, plus session.json describing the windows. The
+id is the window key plus an open counter ("3-7"), so a reused key starts
+new files instead of mixing its windows' frames.
+Index records are only appended once the frame bytes they point to are
+written, so a recording cut short by a crash stays readable.
+
+Recorder sits on the agent side, the broadcast thread only hands it
+references to the frames it sends, a background thread batches the disk
+writes. Recording maps the blobs back with np.memmap for ReplayAgent.
+
+'''
+
+INDEX_DTYPE = np.dtype(
+    [
+        ("time", "<f8"),
+        ("offset", "<i8"),
+        ("ndim", "<i8"),
+        ("shape", "<i8", (MAX_DIMS,)),
+        ("dtype", "S8"),
+    ]
+)
+
+SESSION_FILE = "session.json"
+
+def __json_default__(obj):
+    ### array settings (xdata, levels, ...) come back as arrays on replay
+    if isinstance(obj, np.ndarray):
+        return {"__ndarray__": obj.tolist(), "dtype": obj.dtype.str}
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return str(obj)
+
+def __json_object__(obj):
+    if "__ndarray__" in obj:
+        return np.array(obj["__ndarray__"], dtype=obj["dtype"])
+    return obj
+
+class __Recorder__:
+    """
+    Recorder appends every frame it is given to the recording at `path`
+    (created if needed, appended to if it already exists), flushing to disk
+    every flush_interval seconds on its own thread.
+    """
+
+    def __init__(self, path, flush_interval=0.5, verbose=False):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.verbose = verbose
+        os.makedirs(path, exist_ok=True)
+        self.plots = {}
+        session = os.path.join(path, SESSION_FILE)
+        if os.path.exists(session):
+            with open(session) as f:
+                self.plots = json.load(f, object_hook=__json_object__)["plots"]
+        self.current = {}  ### window key -> recording id of its open window
+        self.files = {}
+        self.pending = []
+        self.plots_dirty = False
+        self.skipped = set()
+        self.cond = threading.Condition()
+        self.active = True
+        self.thread = threading.Thread(
+            target=self.__run__, daemon=True, name="Recorder thread"
+        )
+        self.thread.start()
+
+    def add_plot(self, key, task, plot_settings):
+        with self.cond:
+            ### counts every window ever opened in this recording
+            record_id = f"{key}-{len(self.plots)}"
+            self.current[str(key)] = record_id
+            self.plots[record_id] = {"task": task, "settings": plot_settings, "key": str(key)}
+            self.plots_dirty = True
+        return self
+
+    def record(self, frames, now):
+        ### called from the broadcast thread, keep it to a list append,
+        ### frames go to the window their key belongs to right now
+        with self.cond:
+            frames = {self.current.get(key, key): data for key, data in frames.items()}
+            self.pending.append((now, frames))
+        return self
+
+    def close(self):
+        with self.cond:
+            self.active = False
+            self.cond.notify()
+        self.thread.join()
+        for blob, index in self.files.values():
+            blob.close()
+            index.close()
+        self.files.clear()
+        return self
+
+    def __run__(self):
+        while True:
+            with self.cond:
+                if self.active:
+                    self.cond.wait(self.flush_interval)
+                batch, self.pending = self.pending, []
+                plots = dict(self.plots) if self.plots_dirty else None
+                self.plots_dirty = False
+                active = self.active
+            try:
+                if plots is not None:
+                    self.__write_session__(plots)
+                if batch:
+                    self.__write__(batch)
+            except OSError as e:
+                if self.verbose:
+                    print(f"Recording to {self.path} failed: {e}")
+            if not active:
+                return
+
+    def __write_session__(self, plots):
+        ### small file rewritten whole, swapped in so readers never see half of it
+        session = os.path.join(self.path, SESSION_FILE)
+        with open(session + ".tmp", "w") as f:
+            json.dump({"version": 1, "plots": plots}, f, indent=1, default=__json_default__)
+        os.replace(session + ".tmp", session)
+
+    def __files__(self, key):
+        files = self.files.get(key)
+        if files is None:
+            files = self.files[key] = (
+                open(os.path.join(self.path, f"{key}.bin"), "ab"),
+                open(os.path.join(self.path, f"{key}.idx"), "ab"),
+            )
+        return files
+
+    def __write__(self, batch):
+        records = {}
+        for now, frames in batch:
+            for key, data in frames.items():
+                if isinstance(data, __StreamChunk__):
+                    data = data.data
+                try:
+                    frame = np.ascontiguousarray(data)
+                except ValueError:
+                    frame = None
+                if frame is None or frame.dtype.hasobject or frame.ndim > MAX_DIMS:
+                    if self.verbose and key not in self.skipped:
+                        print(f"Frames of key:{key} cannot be recorded, skipping them")
+                    self.skipped.add(key)
+                    continue
+                blob, _ = self.__files__(key)
+                offset = blob.tell()
+                blob.write(frame.data)
+                shape = frame.shape + (0,) * (MAX_DIMS - frame.ndim)
+                records.setdefault(key, []).append(
+                    (now, offset, frame.ndim, shape, frame.dtype.str)
+                )
+        for key, rows in records.items():
+            blob, index = self.files[key]
+            ### frame bytes must be on disk before the index points at them
+            blob.flush()
+            np.array(rows, dtype=INDEX_DTYPE).tofile(index)
+            index.flush()
+
+class __Recording__:
+    """
+    Recording opens a recording directory read only, frame(id, i) returns
+    the i-th frame of a recorded window as a view into the memory mapped
+    blob.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, SESSION_FILE)) as f:
+            self.plots = json.load(f, object_hook=__json_object__)["plots"]
+        self.index = {}
+        self.blobs = {}
+        for key in self.plots:
+            index_file = os.path.join(path, f"{key}.idx")
+            blob_file = os.path.join(path, f"{key}.bin")
+            if not os.path.exists(index_file) or os.path.getsize(blob_file) == 0:
+                continue
+            self.index[key] = np.fromfile(index_file, dtype=INDEX_DTYPE)
+            self.blobs[key] = np.memmap(blob_file, dtype=np.uint8, mode="r")
+
+    def timeline(self):
+        """
+        Returns (times, keys, frame numbers) of every frame, sorted by time.
+        """
+        keys = list(self.index)
+        if not keys:
+            return np.array([]), np.array([], dtype=object), np.array([], dtype=np.int64)
+        times = np.concatenate([self.index[key]["time"] for key in keys])
+        owners = np.concatenate(
+            [np.full(len(self.index[key]), key, dtype=object) for key in keys]
+        )
+        numbers = np.concatenate([np.arange(len(self.index[key])) for key in keys])
+        order = np.argsort(times, kind="stable")
+        return times[order], owners[order], numbers[order]
+
+    def frame(self, key, i):
+        record = self.index[key][i]
+        ndim = int(record["ndim"])
+        return np.ndarray(
+            tuple(int(n) for n in record["shape"][:ndim]),
+            dtype=np.dtype(record["dtype"].decode()),
+            buffer=self.blobs[key],
+            offset=int(record["offset"]),
+        )
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+import time
+
+'''
+Frame pacing and latency instrumentation for the liveplot pipeline
+
+A FrameStats instance lives on each side of the pipeline for every window key
+(plus one for the agent transmit link). Counters and exponentially weighted
+timings are cheap enough to run on every frame, snapshot() turns them into a
+plain dict that can travel back to the agent through a queue.
+
+Frame stamps: fetch (data_func returned) and send (broadcast thread handed the
+frame to data_q or a shared ring) are stamped in the agent, receive (demux or
+ring read) and render (set_data done) in the plot process.
+
+'''
+
+class __FrameStats__:
+    """
+    FrameStats keeps per key counters (with their rate since the previous
+    snapshot) and smoothed timings in seconds, reported in milliseconds.
+    """
+
+    def __init__(self, smoothing=0.1):
+        self.smoothing = smoothing
+        self.counts = {}
+        self.timings = {}
+        self.marks = {}
+        self.mark_time = time.time()
+        self.stamps = None  ### (fetch, send, receive) of the frame in flight
+        self.rates = {}
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+        return self
+
+    def time(self, name, seconds):
+        last = self.timings.get(name)
+        self.timings[name] = (
+            seconds if last is None
+            else last + self.smoothing * (seconds - last)
+        )
+        return self
+
+    def received(self, fetch_time, send_time):
+        self.count("received")
+        self.stamps = (fetch_time, send_time, time.time())
+        return self
+
+    def rendered(self, start, stop):
+        self.count("rendered")
+        self.time("render", stop - start)
+        if self.stamps is not None:
+            fetch_time, send_time, receive_time = self.stamps
+            if fetch_time:
+                self.time("latency", stop - fetch_time)
+            if send_time:
+                self.time("transit", receive_time - send_time)
+            self.stamps = None
+        return self
+
+    def snapshot(self):
+        now = time.time()
+        elapsed = max(now - self.mark_time, 1e-9)
+        ### rates only move once at least a second has been accumulated so
+        ### frequent snapshots do not turn them into noise
+        if elapsed >= 1:
+            self.rates = {
+                f"{name}_per_s": (count - self.marks.get(name, 0)) / elapsed
+                for name, count in self.counts.items()
+            }
+            self.marks = dict(self.counts)
+            self.mark_time = now
+        snapshot = dict(self.counts)
+        snapshot.update(self.rates)
+        snapshot.update(
+            {f"{name}_ms": seconds * 1e3 for name, seconds in self.timings.items()}
+        )
+        return snapshot
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pytest
+
+from buffers import __RingBuffer__, __HistoryStore__
+from processing import minmax_decimate, rolling_mean, rolling_rms, __Derived__
+from transport import __PackedFrame__, __SharedRing__, __StreamChunk__, HELD
+
+'''
+Checks of the Qt free data path helpers against brute force references:
+ring and archive buffers, min/max decimation, incremental derived series,
+wire packing and the shared memory frame ring
+
+    python -m pytest -q
+
+'''
+
+def chunks_of(total, rng, largest):
+    ### random chunk sizes adding up to total, zero sized ones included
+    sizes = []
+    while sum(sizes) < total:
+        sizes.append(int(rng.integers(0, largest)))
+    sizes[-1] -= sum(sizes) - total
+    return sizes
+
+def brute_envelope(y, start, stop, size):
+    ### min/max of every size samples from start, the last bucket may be short
+    mins, maxs, starts = [], [], []
+    for first in range(start, stop, size):
+        block = y[..., first : min(first + size, stop)]
+        mins.append(block.min(axis=-1))
+        maxs.append(block.max(axis=-1))
+        starts.append(first)
+    envelope = np.empty(y.shape[:-1] + (2 * len(starts),), dtype=y.dtype)
+    envelope[..., 0::2] = np.stack(mins, axis=-1)
+    envelope[..., 1::2] = np.stack(maxs, axis=-1)
+    return np.repeat(starts, 2), envelope
+
+### RingBuffer
+
+@pytest.mark.parametrize("history", [1, 7, 64])
+def test_ring_buffer_keeps_the_newest_history_in_order(history):
+    rng = np.random.default_rng(history)
+    data = rng.normal(size=(3, 500))
+    ring = __RingBuffer__(3, history)
+    done = 0
+    for n in chunks_of(500, rng, 3 * history + 2):
+        ring.extend(data[:, done : done + n])
+        done += n
+        expected = data[:, max(done - history, 0) : done]
+        assert ring.count == expected.shape[-1]
+        np.testing.assert_array_equal(ring.view(), expected)
+
+def test_ring_buffer_view_is_not_a_copy():
+    ring = __RingBuffer__(1, 4).extend(np.arange(6.))
+    assert np.shares_memory(ring.view(), ring.buffer)
+    ring.clear()
+    assert ring.view().shape == (1, 0)
+
+### HistoryStore
+
+def test_history_store_pyramid_levels_match_brute_force():
+    rng = np.random.default_rng(1)
+    data = rng.normal(size=(2, 5000))
+    store = __HistoryStore__(2, factor=4, chunk=256)
+    done = 0
+    for n in chunks_of(5000, rng, 700):
+        store.extend(data[:, done : done + n])
+        done += n
+    assert store.count == 5000
+    np.testing.assert_array_equal(store.raw.slice(0, 5000), data)
+    for k, (mins, maxs) in enumerate(store.levels):
+        size = 4 ** (k + 1)
+        whole = 5000 // size
+        body = data[:, : whole * size].reshape(2, whole, size)
+        assert mins.count == whole
+        np.testing.assert_array_equal(mins.slice(0, whole), body.min(axis=-1))
+        np.testing.assert_array_equal(maxs.slice(0, whole), body.max(axis=-1))
+
+def test_history_store_query_raw_samples():
+    data = np.random.default_rng(2).normal(size=(1, 20000))
+    store = __HistoryStore__(1, factor=4, chunk=1024).extend(data)
+    ### few samples in range: the raw ones, one sample of margin each side
+    xs, ys = store.query(100, 150, 100)
+    np.testing.assert_array_equal(xs, np.arange(99, 152))
+    np.testing.assert_array_equal(ys, data[:, 99:152])
+
+@pytest.mark.parametrize("lo, hi", [(1000, 19000), (2000, 19990), (0, 20000)])
+def test_history_store_query_envelope(lo, hi):
+    data = np.random.default_rng(2).normal(size=(2, 20000))
+    store = __HistoryStore__(2, factor=4, chunk=1024).extend(data)
+    bins = 50
+    xs, ys = store.query(lo, hi, bins)
+    ### the coarsest level that still has a bucket per bin, its whole
+    ### buckets around the range plus the newest samples not in one yet
+    start, stop = max(lo - 1, 0), min(hi + 2, 20000)
+    size = 1
+    while size * 4 * bins <= stop - start:
+        size *= 4
+    last = min(-(-stop // size), 20000 // size)
+    expected_x, expected = brute_envelope(
+        data, start // size * size, max(last * size, stop), size
+    )
+    np.testing.assert_array_equal(xs, expected_x)
+    np.testing.assert_array_equal(ys, expected)
+
+def test_history_store_query_outside_the_data_is_empty():
+    store = __HistoryStore__(2).extend(np.ones((2, 10)))
+    xs, ys = store.query(50, 60, 100)
+    assert len(xs) == 0 and ys.shape == (2, 0)
+
+### minmax_decimate
+
+@pytest.mark.parametrize("n, bins", [(10000, 100), (1003, 10), (5000, 7)])
+def test_minmax_decimate_matches_brute_force(n, bins):
+    y = np.random.default_rng(n).normal(size=(3, n))
+    xs, ys = minmax_decimate(y, bins)
+    size = n // bins
+    expected_x, expected = brute_envelope(y, 0, n, size)
+    np.testing.assert_array_equal(xs, expected_x)
+    np.testing.assert_array_equal(ys, expected)
+    ### every extreme survives decimation
+    np.testing.assert_array_equal(ys.max(axis=-1), y.max(axis=-1))
+    np.testing.assert_array_equal(ys.min(axis=-1), y.min(axis=-1))
+
+def test_minmax_decimate_visible_range_and_x():
+    y = np.random.default_rng(3).normal(size=4000)
+    x = np.linspace(0., 40., 4000)
+    xs, ys = minmax_decimate(y, 20, x=x, lo=10., hi=20.)
+    start = int(np.searchsorted(x, 10., side="right")) - 1
+    stop = int(np.searchsorted(x, 20., side="left")) + 2
+    expected_x, expected = brute_envelope(y, start, stop, (stop - start) // 20)
+    np.testing.assert_array_equal(xs, x[expected_x])
+    np.testing.assert_array_equal(ys, expected)
+
+def test_minmax_decimate_short_traces_come_back_as_slices():
+    y = np.arange(30.)
+    xs, ys = minmax_decimate(y, 100)
+    np.testing.assert_array_equal(xs, np.arange(30))
+    assert np.shares_memory(ys, y)
+
+### Derived
+
+@pytest.mark.parametrize("spec", [("rolling_mean", 1), ("rolling_mean", 25), ("rms", 40), ("rms", 8, 1)])
+def test_derived_extend_matches_the_whole_stream(spec):
+    rng = np.random.default_rng(4)
+    data = rng.normal(size=(2, 3000))
+    derived = __Derived__(spec)
+    pieces, done = [], 0
+    for n in chunks_of(3000, rng, 90):
+        pieces.append(derived.extend(data[:, done : done + n]))
+        done += n
+    np.testing.assert_allclose(np.concatenate(pieces, axis=-1), derived.frame(data), atol=1e-9)
+
+def test_rolling_series_match_brute_force():
+    y = np.random.default_rng(5).normal(size=300)
+    window = 17
+    for i in range(300):
+        block = y[max(i - window + 1, 0) : i + 1]
+        assert rolling_mean(y, window)[i] == pytest.approx(block.mean())
+        assert rolling_rms(y, window)[i] == pytest.approx(np.sqrt((block ** 2).mean()))
+
+def test_derived_rejects_bad_specs():
+    with pytest.raises(ValueError):
+        __Derived__(("median", 5))
+    with pytest.raises(ValueError):
+        __Derived__(("rms", 0))
+
+### PackedFrame
+
+@pytest.mark.parametrize("wire_dtype", ["int8", "int16", "uint16"])
+@pytest.mark.parametrize("codec", [None, "zlib"])
+def test_packed_frame_error_stays_within_one_step(wire_dtype, codec):
+    frame = np.random.default_rng(6).normal(size=(4, 1000)) * [[1.], [10.], [1e-3], [1e4]]
+    packed = __PackedFrame__.pack(frame, wire_dtype, codec)
+    restored = packed.unpack()
+    assert restored.shape == frame.shape
+    bits = np.dtype(wire_dtype).itemsize * 8
+    step = (frame.max(axis=-1) - frame.min(axis=-1)) / 2 ** bits
+    assert (np.abs(restored - frame).max(axis=-1) <= step).all()
+
+def test_packed_frame_float_and_special_rows():
+    frame = np.array([[1.5, -2.25, 3.], [4., 4., 4.], [np.nan, 1., 2.]])
+    np.testing.assert_array_equal(__PackedFrame__.pack(frame[:2], np.float32).unpack(), frame[:2])
+    restored = __PackedFrame__.pack(frame, np.int16).unpack()
+    ### constant rows survive, NaN comes back as the row minimum
+    np.testing.assert_allclose(restored[1], 4.)
+    assert restored[2, 0] == pytest.approx(1.)
+
+### SharedRing
+
+@pytest.fixture
+def rings():
+    writer = __SharedRing__.create(np.zeros(64), slots=4)
+    reader = __SharedRing__.attach(*writer.descriptor())
+    yield writer, reader
+    reader.close()
+    writer.close()
+
+def test_shared_ring_reads_the_newest_frame(rings):
+    writer, reader = rings
+    assert reader.read() is None
+    writer.write(np.full(64, 1.), 1., 2.)
+    frame = reader.read()
+    np.testing.assert_array_equal(frame, 1.)
+    assert reader.last_stamps == pytest.approx((1., 2.))
+    assert reader.read() is None  ### nothing new
+    for i in range(2, 6):
+        writer.write(np.full(10, float(i)))
+    frame = reader.read()
+    assert frame.shape == (10,) and (frame == 5.).all()
+    assert reader.skipped == 3
+
+def test_shared_ring_never_overwrites_frames_the_reader_holds(rings):
+    writer, reader = rings
+    held = []
+    for i in range(1, 200):
+        writer.write(np.full(64, float(i)))
+        if i % 7 == 0:
+            frame = reader.read()
+            held = (held + [(frame, float(i))])[-HELD:]
+        ### the frame shown and the one just read stay intact however
+        ### often the agent laps the ring meanwhile
+        for frame, value in held:
+            assert (frame == value).all()
+
+def test_shared_ring_fits_and_close(rings):
+    writer, reader = rings
+    assert writer.fits(np.zeros(100))
+    assert not writer.fits(np.zeros(1000))
+    assert not writer.fits(np.zeros(10, dtype=np.float32))
+    writer.write(np.ones(64))
+    reader.close()
+    assert reader.read() is None
+
+### StreamChunk
+
+def test_stream_chunk_merge_keeps_history_and_restarts():
+    older = __StreamChunk__(np.arange(6.)[None], 8)
+    merged = older.merge(__StreamChunk__(np.arange(6., 10.)[None], 8))
+    np.testing.assert_array_equal(merged.data, np.arange(2., 10.)[None])
+    restart = __StreamChunk__(np.zeros((1, 2)), 8, restart=True)
+    assert older.merge(restart) is restart
+    assert restart.merge(older).restart
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+
+import zlib
+
+import numpy as np
+from multiprocess import shared_memory
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+'''
+Shared memory transport for the liveplot data ecosystem
+
+Each window key owns one shared memory block holding a small ring of
+preallocated numpy frame buffers plus an int64 header. The LivePlotAgent
+writes frames into the ring in place and bumps a sequence counter, the
+LivePlotProcess maps the same block and hands out numpy views of the newest
+slot, so no frame is ever pickled. The plot process publishes the sequence
+numbers of the frames its window may still draw and the agent never writes
+into those slots.
+
+header layout (int64 words):
+    [0]                         global sequence counter (frames written)
+    [1]                         slot of the newest frame
+    [2 : 2 + HELD]              sequence numbers the reader holds (0 for none)
+    [HEADER_WORDS + slot * SLOT_WORDS + 0]
+                                slot stamp, sequence number of slot contents
+                                (-1 while the agent is writing into it)
+    [HEADER_WORDS + slot * SLOT_WORDS + 1] ndim of slot contents
+    [HEADER_WORDS + slot * SLOT_WORDS + 2] fetch time stamp (ns)
+    [HEADER_WORDS + slot * SLOT_WORDS + 3] send time stamp (ns)
+    [HEADER_WORDS + slot * SLOT_WORDS + 4:] shape (MAX_DIMS entries)
+
+Frames that do travel through data_q can be packed first: PackedFrame holds
+a down converted (float32, or int8/int16 with per row scale and offset) and
+optionally compressed copy that the plot process unpacks before drawing.
+
+'''
+
+MAX_DIMS = 4
+SLOT_WORDS = 4 + MAX_DIMS
+### the frame a window shows and the one it is about to get, windows only
+### read again once the previous frame went through update()
+HELD = 2
+HEADER_WORDS = 2 + HELD
+ALIGNMENT = 64
+
+CODECS = {"zlib": (lambda raw: zlib.compress(raw, 1), zlib.decompress)}
+if lz4_frame is not None:
+    CODECS["lz4"] = (lz4_frame.compress, lz4_frame.decompress)
+
+def __aligned__(nbytes):
+    return int(-(-nbytes // ALIGNMENT) * ALIGNMENT)
+
+class __SharedRing__:
+    """
+    SharedRing wraps one shared memory block laid out as a ring of `slots`
+    frame buffers of `capacity` bytes each. The agent side creates it (owner)
+    and only ever writes, the plot process attaches by name and only reads.
+
+    Views returned by read() point straight into shared memory, they stay
+    valid until HELD further frames have been read: the reader publishes the
+    sequence numbers it holds and the writer skips their slots, so the ring
+    needs at least HELD + 1 slots.
+    """
+
+    def __init__(self, shm, dtype, slots, capacity, owner):
+        self.shm = shm
+        self.name = shm.name
+        self.dtype = np.dtype(dtype)
+        self.slots = slots
+        self.capacity = capacity
+        self.owner = owner
+        self.header_bytes = __aligned__(8 * (HEADER_WORDS + slots * SLOT_WORDS))
+        self.header = np.ndarray(
+            (HEADER_WORDS + slots * SLOT_WORDS,), dtype=np.int64, buffer=shm.buf
+        )
+        self.last_seq = 0
+        self.last_stamps = (0., 0.)
+        self.skipped = 0  ### frames overwritten before the last read saw them
+
+    @classmethod
+    def create(cls, frame, slots=4, headroom=2):
+        ### headroom leaves space for the frame to grow before we
+        ### have to reallocate and re-attach on the plot side
+        capacity = __aligned__(max(frame.nbytes, 1) * headroom)
+        slots = max(int(slots), HELD + 1)
+        header_bytes = __aligned__(8 * (HEADER_WORDS + slots * SLOT_WORDS))
+        shm = shared_memory.SharedMemory(
+            create=True, size=header_bytes + slots * capacity
+        )
+        ring = cls(shm, frame.dtype, slots, capacity, owner=True)
+        ring.header[:] = 0
+        return ring
+
+    @classmethod
+    def attach(cls, name, dtype, slots, capacity):
+        shm = shared_memory.SharedMemory(name=name)
+        return cls(shm, dtype, slots, capacity, owner=False)
+
+    def descriptor(self):
+        ### everything the plot process needs to map this ring
+        return (self.name, self.dtype.str, self.slots, self.capacity)
+
+    def fits(self, frame):
+        return (
+            frame.dtype == self.dtype
+            and frame.nbytes <= self.capacity
+            and frame.ndim <= MAX_DIMS
+        )
+
+    def __meta__(self, header, slot):
+        start = HEADER_WORDS + slot * SLOT_WORDS
+        return header[start : start + SLOT_WORDS]
+
+    def __view__(self, slot, shape):
+        return np.ndarray(
+            shape,
+            dtype=self.dtype,
+            buffer=self.shm.buf,
+            offset=self.header_bytes + slot * self.capacity,
+        )
+
+    def write(self, frame, fetch_time=0., send_time=0.):
+        header = self.header
+        seq = int(header[0])
+        slot = int(header[1])
+        while True:
+            ### next slot whose frame the reader does not hold, there are
+            ### always HELD + 1 slots so one is free
+            slot = (slot + 1) % self.slots
+            meta = self.__meta__(header, slot)
+            stamp = int(meta[0])
+            if stamp and stamp in header[2 : 2 + HELD]:
+                continue
+            meta[0] = -1
+            ### the reader may have taken it between our check and the mark,
+            ### it checks the mark after publishing, one of us sees the other
+            if stamp and stamp in header[2 : 2 + HELD]:
+                meta[0] = stamp
+                continue
+            break
+        np.copyto(self.__view__(slot, frame.shape), frame, casting="no")
+        meta[1] = frame.ndim
+        meta[2] = int(fetch_time * 1e9)
+        meta[3] = int(send_time * 1e9)
+        meta[4 : 4 + frame.ndim] = frame.shape
+        meta[0] = seq + 1
+        header[1] = slot
+        header[0] = seq + 1
+        return seq + 1
+
+    def read(self):
+        """
+        Returns a zero copy view of the newest frame, or None if nothing new
+        has been written since the last read. The view stays untouched by the
+        writer until HELD more frames have been read.
+        """
+        header = self.header
+        if header is None:
+            ### closed from the GUI thread while a WorkerBee still polls
+            return None
+        seq = int(header[0])
+        if seq == 0 or seq == self.last_seq:
+            return None
+        slot = int(header[1])
+        meta = self.__meta__(header, slot)
+        if meta[0] != seq:
+            ### agent moved on while we looked, a newer frame will be
+            ### readable on the next call
+            return None
+        ### the frame the window still shows and the one it gets now
+        header[2 : 2 + HELD] = (self.last_seq, seq)
+        if meta[0] != seq:
+            ### the agent marked the slot before it saw our claim
+            header[2 + HELD - 1] = 0
+            return None
+        shape = tuple(int(n) for n in meta[4 : 4 + meta[1]])
+        self.skipped = seq - self.last_seq - 1
+        self.last_seq = seq
+        self.last_stamps = (meta[2] * 1e-9, meta[3] * 1e-9)
+        return self.__view__(slot, shape)
+
+    def close(self):
+        self.header = None
+        try:
+            self.shm.close()
+        except BufferError:
+            ### a window still holds a view into the block, the mapping
+            ### goes away once that view is garbage collected
+            pass
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+        return
+
+class __StreamChunk__:
+    """
+    StreamChunk tags data_q payloads of streaming plots, the plot process
+    appends these to whatever is still pending for the key instead of
+    replacing it, keeping at most `history` samples. restart=True makes the
+    window start its stream over (drop its ring and archive) before taking
+    the chunk.
+    """
+
+    __slots__ = ("data", "history", "restart")
+
+    def __init__(self, data, history, restart=False):
+        self.data = data
+        self.history = history
+        self.restart = restart
+
+    def merge(self, newer):
+        if newer.restart:
+            ### the window starts over, whatever was pending goes with it
+            return newer
+        data = np.concatenate((self.data, newer.data), axis=-1)
+        return __StreamChunk__(data[..., -newer.history :], newer.history, self.restart)
+
+class __PackedFrame__:
+    """
+    PackedFrame tags data_q payloads that were shrunk for the wire. Integer
+    wire dtypes map each row (last axis) linearly onto the full integer
+    range, so unpack() returns float64 within (hi - lo) / 2**bits of the
+    original; NaN comes back as the row minimum.
+    """
+
+    __slots__ = ("payload", "dtype", "shape", "scale", "offset", "codec")
+
+    def __init__(self, payload, dtype, shape, scale=None, offset=None, codec=None):
+        self.payload = payload
+        self.dtype = dtype
+        self.shape = shape
+        self.scale = scale
+        self.offset = offset
+        self.codec = codec
+
+    @classmethod
+    def pack(cls, frame, wire_dtype, codec=None):
+        wire_dtype = np.dtype(wire_dtype)
+        scale = offset = None
+        if wire_dtype.kind in "iu":
+            info = np.iinfo(wire_dtype)
+            ### fmin/fmax skip NaN instead of spreading it over the row
+            lo = np.fmin.reduce(frame, axis=-1, keepdims=True).astype(np.float64)
+            hi = np.fmax.reduce(frame, axis=-1, keepdims=True).astype(np.float64)
+            scale = (hi - lo) / (float(info.max) - float(info.min))
+            scale[scale == 0] = 1.
+            offset = lo - info.min * scale
+            scaled = np.rint((frame - offset) / scale)
+            np.clip(scaled, info.min, info.max, out=scaled)
+            np.nan_to_num(scaled, copy=False, nan=info.min)
+            payload = scaled.astype(wire_dtype)
+        else:
+            payload = frame.astype(wire_dtype, copy=False)
+        if codec is not None:
+            payload = CODECS[codec][0](np.ascontiguousarray(payload).data)
+        return cls(payload, wire_dtype, frame.shape, scale, offset, codec)
+
+    @property
+    def nbytes(self):
+        if self.codec is not None:
+            return len(self.payload)
+        return self.payload.nbytes
+
+    def unpack(self):
+        payload = self.payload
+        if self.codec is not None:
+            payload = np.frombuffer(
+                CODECS[self.codec][1](payload), dtype=self.dtype
+            ).reshape(self.shape)
+        if self.scale is not None:
+            return payload * self.scale + self.offset
+        return payload
+
+def encode_frame(data, wire_dtype, compress=None, shared=False):
+    """
+    Shrinks numeric data for the wire as set by wire_dtype / compress,
+    anything else is returned as is. Frames for shared rings (shared=True)
+    are never pickled, so only float conversions apply to them.
+    """
+    if isinstance(data, __StreamChunk__):
+        ### chunks always travel through data_q
+        return __StreamChunk__(
+            encode_frame(data.data, wire_dtype, compress), data.history, data.restart
+        )
+    try:
+        frame = np.asarray(data)
+    except ValueError:
+        return data
+    if frame.dtype.kind not in "fiu" or frame.ndim == 0:
+        return data
+    wire_dtype = wire_dtype or frame.dtype
+    if shared or (compress is None and wire_dtype.kind == "f"):
+        ### integer wire dtypes would need their scale carried along
+        if wire_dtype.kind != "f":
+            wire_dtype = np.dtype(np.float32)
+        if frame.dtype.kind == "f" and frame.dtype.itemsize > wire_dtype.itemsize:
+            return frame.astype(wire_dtype)
+        return frame
+    return __PackedFrame__.pack(frame, wire_dtype, compress)
@@ -3,11 +3,14 @@
 from pyqtgraph.Qt import QtGui, QtCore, QtWidgets
 import pyqtgraph as pg
 import numpy as np
+import time
 
 from queue import Empty
 
 
 from worker import __WorkerBee__
+from buffers import __RingBuffer__, __HistoryStore__
+from processing import minmax_decimate, scale_policy, __Derived__, __Bounds__
 
 
 '''
@@ -27,6 +30,9 @@ ecosystem based on multiprocessing task/data queues
 
 class __LiveWindowLike__(QtWidgets.QWidget):
 
+    ### emitted once, when the plot window gets closed (by the user or us)
+    sigClosed = QtCore.pyqtSignal()
+
     def __init__(
         self,
         data_func,
@@ -37,10 +43,26 @@ class __LiveWindowLike__(QtWidgets.QWidget):
         no_plots,
         plot_labels,
         verbose,
+        stream=False,
+        history=1000,
+        decimate=True,
+        xdata=None,
+        readout_interval=0.25,
+        scheduled=False,
+        stats_overlay=False,
+        canvas=None,
+        autoscale="auto",
+        scale_decay=0.05,
+        scale_percentile=1.,
     ):
         super().__init__()
-        self.window = pg.GraphicsLayoutWidget(show=True, title="Live Plotting Window")
-        self.window.resize(900, 500)
+        if canvas is None:
+            self.window = pg.GraphicsLayoutWidget(show=True, title="Live Plotting Window")
+            self.window.resize(900, 500)
+            self.canvas = self.window.ci
+        else:
+            ### a (widget, cell layout) pair handed out by a LiveDashboard
+            self.window, self.canvas = canvas
         pg.setConfigOptions(antialias=True)
         
         self.xlabel = xlabel
@@ -50,15 +72,90 @@ class __LiveWindowLike__(QtWidgets.QWidget):
         self.no_plots = no_plots
         self.plot_labels = plot_labels
         self.verbose = verbose
-
+        ### streaming windows receive only new samples and keep the
+        ### last `history` of them in a preallocated ring
+        self.stream = stream
+        self.history = history
+        self.ring = None
+        self.restarting = False  ### set by the plot process, see restart()
+        ### line windows draw a min/max envelope of the full resolution
+        ### data, recomputed whenever the view is zoomed, panned or resized
+        self.decimate = decimate
+        self.full_data = None
+        self.redrawing = False
+        ### xdata=None plots against sample index (cached per length),
+        ### xdata="first" takes row 0 of every frame as the shared x axis,
+        ### an array is used as a fixed x axis for every frame
+        self.xdata = xdata
+        self.x_cache = {}
+        ### last value readout, updated at most every readout_interval
+        ### seconds (None switches it off)
+        self.readout_interval = readout_interval
+        self.readout = None
+        self.readout_time = 0.
+        ### set by the plot process when the agent is instrumented
+        self.frame_stats = None
+        self.stats_overlay = stats_overlay
+        self.overlay = None
+        self.overlay_time = 0.
+        ### render cost and pacing, read and set by a RefreshGovernor
+        self.base_interval = refresh_interval
+        self.update_time = 0.
+        self.paint_share = 1.  ### of the widget's paints, panels of a dashboard split them
+        self.paused = False
+        ### autoscale policies other than "auto" set the view themselves
+        ### from incrementally tracked bounds (see processing.__Bounds__)
+        self.scale_policy, self.scale_limits = scale_policy(autoscale)
+        self.scale_decay = scale_decay
+        self.scale_percentile = scale_percentile
+        self.following = {}  ### watched viewbox -> view tracks the data
+        self.view_ranges = {}  ### watched viewbox -> (x, y) range set last
+
+        ### scheduled windows are driven by the process RenderClock
+        ### instead of starting their own WorkerBee thread
+        self.data_func = data_func
+        self.scheduled = scheduled
         self.worker = __WorkerBee__(data_func, self.isHidden, self.refresh_interval)
         self.make_connection(self.worker)
+        self.closed = False
+        self.window.installEventFilter(self)
+
+    def start_worker(self):
+        if not self.scheduled:
+            self.worker.start()
+        return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        self.window.close()
+        if not self.closed:
+            self.window.close()
         if self.verbose:
             print("LivePlotterWindow exiting ciao bella ciao")
 
+    def eventFilter(self, obj, event):
+        if obj is self.window and event.type() == QtCore.QEvent.Close and not self.closed:
+            self.closed = True
+            self.sigClosed.emit()
+        return False
+
+    def release(self):
+        """
+        Frees the buffers and hands the widgets to Qt for deletion once the
+        window is closed. Returns the WorkerBee if its thread is still winding
+        down (it must be kept referenced until it finishes), else None.
+        """
+        self.ring = None
+        self.full_data = None
+        self.x_cache.clear()
+        self.following.clear()
+        self.view_ranges.clear()
+        self.window.removeEventFilter(self)
+        self.worker.stop()
+        self.window.deleteLater()
+        self.deleteLater()
+        if self.worker.isRunning():
+            return self.worker
+        return None
+
     def isHidden(self):
         return self.window.isHidden()
 
@@ -69,36 +166,314 @@ class __LiveWindowLike__(QtWidgets.QWidget):
 
     @QtCore.pyqtSlot(bool)
     def self_destruct(self, yes):
-        if yes:
+        if yes and not self.closed:
             self.__exit__(None, None, None)
 
     @QtCore.pyqtSlot(np.ndarray)
     def update(self, data):
+        if self.worker.pending == "queued":
+            self.worker.pending = "drawn"
+        if self.closed:
+            ### queued before the window went away
+            return self
         if data.shape == (0,):
             if self.verbose:
                 print("data is empty, skipping this cycle, please correct this")
+            return self
+        start = time.time()
+        if self.stream:
+            if self.restarting:
+                self.restarting = False
+                self.restart()
+            self.append_data(data)
         else:
             self.set_data(data)
+        self.update_time += 0.2 * (time.time() - start - self.update_time)
+        if self.frame_stats is not None:
+            self.frame_stats.rendered(start, time.time())
+            self.show_overlay()
         return self 
 
+    def restart(self):
+        ### the stream starts over (a replay seeked), the next chunk
+        ### allocates a fresh ring
+        self.ring = None
+        return self
+
+    def append_data(self, chunk):
+        chunk = np.atleast_2d(chunk)
+        if self.ring is None or self.ring.channels != chunk.shape[0]:
+            self.ring = __RingBuffer__(chunk.shape[0], self.history, chunk.dtype)
+            self.reset_bounds()
+        self.ring.extend(chunk)
+        self.track_chunk(chunk)
+        self.set_data(self.ring.view())
+        return self
+
+    def reset_bounds(self):
+        ### windows with autoscaled views forget the data their bounds saw
+        return self
+
+    def track_chunk(self, chunk):
+        ### and feed the new samples of a stream into them
+        return self
+
+    def watch_paint(self):
+        ### smoothed paint time of the widget, wrapped once however many
+        ### panels of a dashboard share it
+        if hasattr(self.window, "paint_time"):
+            return self
+        widget = self.window
+        widget.paint_time = 0.
+        paint_event = widget.paintEvent
+
+        def timed_paint(event):
+            start = time.perf_counter()
+            paint_event(event)
+            widget.paint_time += 0.2 * (time.perf_counter() - start - widget.paint_time)
+
+        widget.paintEvent = timed_paint
+        return self
+
+    def render_cost(self):
+        """
+        Smoothed seconds of GUI thread one refresh of this window costs.
+        """
+        return self.update_time + getattr(self.window, "paint_time", 0.) * self.paint_share
+
+    def visibility(self):
+        """
+        "hidden" (minimized or not exposed, nothing to draw for), "active"
+        (has the focus) or "visible".
+        """
+        handle = self.window.windowHandle()
+        if (
+            self.window.isMinimized()
+            or not self.window.isVisible()
+            or (handle is not None and not handle.isExposed())
+        ):
+            return "hidden"
+        if self.window.isActiveWindow():
+            return "active"
+        return "visible"
+
+    def set_refresh(self, interval, paused):
+        self.refresh_interval = interval
+        self.worker.refresh_interval = interval
+        self.worker.paused = paused
+        self.paused = paused
+        return self
+
+    def watch_view(self, viewbox):
+        viewbox.sigXRangeChanged.connect(self.redecimate)
+        viewbox.sigResized.connect(self.redecimate)
+        return self
+
+    def new_bounds(self):
+        return __Bounds__(
+            self.scale_policy,
+            self.scale_limits,
+            self.scale_decay,
+            self.scale_percentile,
+            window=self.history if self.stream else None,
+        )
+
+    def watch_scale(self, viewbox):
+        ### pyqtgraph's auto range rescans every item's data for its bounds
+        ### (both axes, even if only one auto ranges), so autoscaled views
+        ### are set by rescale instead until the user pans or zooms them
+        if self.scale_policy == "auto":
+            return self
+        viewbox.disableAutoRange()
+        self.following[viewbox] = True
+        viewbox.sigRangeChangedManually.connect(
+            lambda mask: self.following.__setitem__(viewbox, False)
+        )
+        return self
+
+    def follows(self, viewbox):
+        ### x range tracks the data, by pyqtgraph's auto range or rescale
+        return viewbox.autoRangeEnabled()[0] or self.following.get(viewbox, False)
+
+    def extent(self, x, n):
+        ### x range of n samples, x assumed sorted
+        if x is not None and len(x) == n and n:
+            return float(x[0]), float(x[-1])
+        return 0., float(max(n - 1, 0))
+
+    def sample(self, y):
+        ### every value for percentiles of short traces, a strided pick of long ones
+        return y[..., :: max(y.shape[-1] // 4096, 1)]
+
+    def scale_view(self, viewbox, bounds, extent, drawn, y):
+        """
+        Updates bounds with what was just drawn on viewbox (drawn, the
+        decimated traces, unless a stream already fed its chunks) and
+        rescales the view. y is the data in view, sampled for percentiles.
+        """
+        if not self.stream or bounds.empty:
+            bounds.frame(*drawn)
+        bounds.settle(self.sample(y) if bounds.policy == "percentile" else None)
+        return self.rescale(viewbox, bounds, extent)
+
+    def rescale(self, viewbox, bounds, extent):
+        if viewbox not in self.following:
+            return self
+        if any(viewbox.autoRangeEnabled()):
+            ### "A" button, the view follows the data again
+            viewbox.disableAutoRange()
+            self.following[viewbox] = True
+            self.view_ranges.pop(viewbox, None)
+        if not self.following[viewbox] or bounds.shown is None:
+            return self
+        view = (extent, bounds.shown)
+        if view == self.view_ranges.get(viewbox):
+            return self
+        self.view_ranges[viewbox] = view
+        ### the traces were just decimated over all of x, no need to redo it
+        redrawing, self.redrawing = self.redrawing, True
+        try:
+            viewbox.setRange(xRange=extent, yRange=bounds.shown)
+        finally:
+            self.redrawing = redrawing
+        return self
+
+    def index_x(self, n):
+        x = self.x_cache.get(n)
+        if x is None:
+            if len(self.x_cache) > 8:
+                self.x_cache.clear()
+            x = self.x_cache[n] = np.arange(n)
+        return x
+
+    def split_xy(self, data):
+        if isinstance(self.xdata, str):
+            return data[0], data[1:]
+        return self.xdata, data
+
+    def decimated(self, viewbox, y, x=None):
+        ### y is one trace, or a (channels, n) block sharing x
+        if x is None or len(x) != y.shape[-1]:
+            x = self.index_x(y.shape[-1])
+        if not self.decimate:
+            return x, y
+        lo, hi = (None, None)
+        if not self.follows(viewbox):
+            lo, hi = viewbox.viewRange()[0]
+        bins = max(int(viewbox.width()), 100)
+        return minmax_decimate(y, bins, x=x, lo=lo, hi=hi)
+
+    def add_readout(self, viewbox):
+        if self.readout_interval is None:
+            return self
+        ### parented to the viewbox itself so it stays put when panning,
+        ### setText on it never triggers a layout pass unlike setTitle
+        self.readout = pg.TextItem(color="w", anchor=(0, 0))
+        self.readout.setParentItem(viewbox)
+        self.readout.setPos(10, 10)
+        return self
+
+    def add_overlay(self, viewbox):
+        if not self.stats_overlay:
+            return self
+        self.overlay = pg.TextItem(color="y", anchor=(0, 1))
+        self.overlay.setParentItem(viewbox)
+        viewbox.sigResized.connect(
+            lambda vb: self.overlay.setPos(10, vb.height() - 10)
+        )
+        return self
+
+    def show_overlay(self):
+        if self.overlay is None or time.time() - self.overlay_time < 0.5:
+            return self
+        self.overlay_time = time.time()
+        stats = self.frame_stats.snapshot()
+        self.overlay.setText(
+            f"{stats.get('rendered_per_s', 0.):.1f} fps | "
+            f"latency {stats.get('latency_ms', 0.):.1f} ms | "
+            f"render {stats.get('render_ms', 0.):.1f} ms | "
+            f"stale {stats.get('stale', 0)}"
+        )
+        return self
+
+    def show_readout(self, channels):
+        if self.readout is None:
+            return self
+        now = time.time()
+        if now - self.readout_time < self.readout_interval:
+            return self
+        self.readout_time = now
+        self.readout.setText(
+            " | ".join(f"{y[-1]:.6g}" for y in channels[: self.no_plots] if len(y))
+        )
+        return self
+
+    def redecimate(self, *args):
+        if self.decimate and self.full_data is not None and not self.redrawing:
+            self.redrawing = True
+            try:
+                self.set_data(self.full_data)
+            finally:
+                self.redrawing = False
+        return self
+
+class __LiveDashboard__:
+    """
+    LiveDashboard is one GraphicsLayoutWidget shared by a grid of panels.
+    Every panel is a regular window object (own key, data and worker)
+    drawing into its own cell, closing the dashboard closes all of them.
+    """
+
+    def __init__(self, title, panels, columns=None):
+        self.columns = columns or int(np.ceil(np.sqrt(panels)))
+        rows = -(-panels // self.columns)
+        self.window = pg.GraphicsLayoutWidget(show=True, title=title)
+        self.window.resize(min(450 * self.columns, 1800), min(300 * rows, 1200))
+
+    def cell(self, i):
+        row, col = divmod(i, self.columns)
+        return self.window, self.window.addLayout(row=row, col=col)
+
 class __LivePlotterWindow__(__LiveWindowLike__):
     """
     LivePlotterWindow is a QWidget object that contains a pyqtgraph window.
     The pyqtgraph window is updated by the WorkerBee object.
+
+    derived=[("rolling_mean", 100), ("rms", 50), ("fft", 4096), ...] adds
+    derived series computed here from the frames already received (see
+    processing.__Derived__): rolling ones are drawn dashed over their
+    channel, spectra in a second plot below.
+
+    archive=True (streaming windows plotted against sample number only)
+    keeps every sample received in a HistoryStore and draws the traces from
+    it: the view follows the newest `history` samples until the user zooms
+    or pans, then shows whatever part of the whole session is in view at
+    the pyramid level that fits it. Autorange ("A") goes back to following.
     """
 
-    def __init__(self, **kwargs):
+    def __init__(self, derived=None, archive=False, **kwargs):
+        self.derived = [__Derived__(spec) for spec in derived or []]
+        self.derived_rings = [None] * len(self.derived)
+        self.spectrum = None
+        if archive and (not kwargs.get("stream") or kwargs.get("xdata") is not None):
+            raise ValueError("archive needs stream=True and xdata=None")
+        if archive:
+            ### drawn from the pyramid, so always decimated
+            kwargs["decimate"] = True
+        self.archive = archive
+        self.store = None
 
         super().__init__(**kwargs)
+        self.bounds = None if self.scale_policy == "auto" else self.new_bounds()
         self.setup_plots()
-        self.worker.start()
+        self.start_worker()
 
 
     def setup_plots(self):
         """
         Setup the plots, axes, legend, and styling.
         """
-        self.graph = self.window.addPlot(title=self.title)
+        self.graph = self.canvas.addPlot(title=self.title)
         self.graph.setTitle(self.title, color="grey", size="20pt")
 
         legend = self.graph.addLegend()
@@ -121,10 +496,44 @@ class __LivePlotterWindow__(__LiveWindowLike__):
 
         for i in range(self.no_plots):
             self.plots.append(
-                self.graph.plot(pen=i, name = f"Channel {self.plot_labels[i]}!!!")
-                if self.plot_labels
-                else self.graph.plot(pen=i, name = f"Channel {i+1}!!!")
+                self.graph.plot(pen=i, name = self.channel_name(i))
                 )
+        self.watch_view(self.graph.getViewBox())
+        self.watch_scale(self.graph.getViewBox())
+        self.add_readout(self.graph.getViewBox())
+        self.add_overlay(self.graph.getViewBox())
+        self.setup_derived()
+
+    def channel_name(self, i):
+        if self.plot_labels:
+            return f"Channel {self.plot_labels[i]}!!!"
+        return f"Channel {i+1}!!!"
+
+    def setup_derived(self):
+        self.derived_curves = []
+        for derived in self.derived:
+            if derived.spectral and self.spectrum is None:
+                self.canvas.nextRow()
+                self.spectrum = self.canvas.addPlot()
+                self.spectrum.addLegend()
+                self.spectrum.showGrid(x=True, y=True)
+                self.spectrum.getAxis("bottom").setTickFont(self.tickfont)
+                self.spectrum.getAxis("left").setTickFont(self.tickfont)
+                self.spectrum.setLabel("bottom", "frequency", **self.styling)
+                self.watch_view(self.spectrum.getViewBox())
+            graph = self.spectrum if derived.spectral else self.graph
+            self.derived_curves.append(
+                [
+                    graph.plot(
+                        pen=pg.mkPen(i, style=QtCore.Qt.DashLine)
+                        if not derived.spectral
+                        else i,
+                        name=derived.label(self.channel_name(i)),
+                    )
+                    for i in derived.sources(self.no_plots)
+                ]
+            )
+        return self
 
     def set_xlabel(self, label):
         self.graph.setLabel("bottom", label, **self.styling)
@@ -134,92 +543,340 @@ class __LivePlotterWindow__(__LiveWindowLike__):
 
     def set_data(self, data):
         try:
-            last_numbers = "|"
-            for i, plot in enumerate(self.plots):
-                plot.setData(np.arange(len(data[i])), data[i])
-                last_numbers += f" {data[i][-1]} |"
+            self.full_data = data
+            x, channels = self.split_xy(data)
+            viewbox = self.graph.getViewBox()
+            if self.store is not None:
+                x = self.set_archived(viewbox, channels.shape[-1])
+            else:
+                drawn = []
+                for i, plot in enumerate(self.plots):
+                    xs, ys = self.decimated(viewbox, channels[i], x)
+                    plot.setData(xs, ys)
+                    drawn.append(ys)
+                if self.bounds is not None:
+                    extent = self.extent(x, channels.shape[-1])
+                    self.scale_view(viewbox, self.bounds, extent, drawn, channels[: self.no_plots])
+            self.show_readout(channels)
+            if self.derived:
+                self.set_derived(x, channels)
 
-            self.graph.setTitle(last_numbers, color="white", size="20pt")
-            
         except IndexError:
             print("IndexError: data is not in the correct format")
 
+    def set_archived(self, viewbox, n):
+        ### the ring holds the newest n samples, the store all of them
+        count = self.store.count
+        if self.follows(viewbox):
+            lo, hi = count - n, count
+        else:
+            lo, hi = viewbox.viewRange()[0]
+        xs, ys = self.store.query(lo, hi, max(int(viewbox.width()), 100))
+        for plot, y in zip(self.plots, ys):
+            plot.setData(xs, y)
+        if self.bounds is not None:
+            self.scale_view(viewbox, self.bounds, (count - n, count - 1), ys, ys)
+        ### sample numbers of the ring, for the derived series drawn over it
+        return np.arange(count - n, count) if self.derived else None
+
+    def set_derived(self, x, channels):
+        for derived, curves, ring in zip(
+            self.derived, self.derived_curves, self.derived_rings
+        ):
+            if derived.spectral:
+                spacing = 1.
+                if x is not None and len(x) > 1:
+                    spacing = (x[-1] - x[0]) / (len(x) - 1)
+                freqs, values = derived.frame(channels, spacing)
+                viewbox = self.spectrum.getViewBox()
+            else:
+                ### streams keep their rolling series up to date in append_data
+                freqs = x
+                values = ring.view() if ring is not None else derived.frame(channels)
+                viewbox = self.graph.getViewBox()
+            if not len(values):
+                continue
+            xs, ys = self.decimated(viewbox, values, freqs)
+            for curve, y in zip(curves, ys):
+                curve.setData(xs, y)
+        return self
+
+    def append_data(self, chunk):
+        if self.derived:
+            chunk = np.atleast_2d(chunk)
+            if self.ring is None or self.ring.channels != chunk.shape[0]:
+                ### window ring starts over, so do the rolling series
+                for derived in self.derived:
+                    derived.reset()
+                self.derived_rings = [None] * len(self.derived)
+            _, rows = self.split_xy(chunk)
+            for i, derived in enumerate(self.derived):
+                if derived.spectral:
+                    continue
+                values = derived.extend(rows)
+                if self.derived_rings[i] is None:
+                    self.derived_rings[i] = __RingBuffer__(values.shape[0], self.history)
+                self.derived_rings[i].extend(values)
+        if self.archive:
+            chunk = np.atleast_2d(chunk)
+            if self.store is None or self.store.channels != chunk.shape[0]:
+                self.store = __HistoryStore__(chunk.shape[0], chunk.dtype)
+            self.store.extend(chunk)
+        return super().append_data(chunk)
+
+    def restart(self):
+        ### the archive starts over too, derived series follow the ring
+        self.store = None
+        return super().restart()
+
+    def reset_bounds(self):
+        if self.bounds is not None:
+            self.bounds.reset()
+        return self
+
+    def track_chunk(self, chunk):
+        if self.bounds is not None:
+            self.bounds.chunk(self.split_xy(chunk)[1][: self.no_plots])
+        return self
+
+    def release(self):
+        self.store = None
+        return super().release()
+
 class __LiveMultiWindow__(__LiveWindowLike__):
+    """
+    LiveMultiWindow draws every channel in a plot of its own, `columns`
+    plots to a row. page_size=n only builds n plots and shows one page of
+    channels at a time (PageUp/PageDown flip pages), channels off the page
+    are never decimated or handed to pyqtgraph.
+
+    stacked=True draws all channels in one plot with shared axes instead,
+    every channel in a lane of its own, as a single path item drawn in one
+    call. spacing=None scales every channel into its lane, a number offsets
+    the raw data by that much per channel. Only lanes inside the visible y
+    range are drawn while the y axis is not auto ranging.
+    """
 
     ### this is link to the parent class decorated functions
 
-    def __init__(self, **kwargs):
+    def __init__(self, stacked=False, spacing=None, page_size=None, columns=3, **kwargs):
+        self.stacked = stacked
+        self.spacing = spacing
+        self.page_size = page_size
+        self.columns = columns
+        self.page = 0
         super().__init__(**kwargs)
 
-        self.window = pg.GraphicsLayoutWidget(show = True, title = "Live Plotting Window")
-        self.window.resize(900,500)
-        # just antialiasing
-        pg.setConfigOptions(antialias = True)
-        # Creates graph object
-        
         self.graphs = []
         self.plot = []
-        self.initial_ydata = np.array([[0.]])
+        self.legends = []
+        self.cell_bounds = []  ### of every grid plot, when autoscaled
         self.setup_plots()
-        self.worker.start()
+        self.start_worker()
+
+    def channel_name(self, i):
+        if self.plot_labels:
+            return f"Channel {self.plot_labels[i]}!!!"
+        return f"Channel {i+1}!!!"
 
     def setup_plots(self):
         self.tickfont = QtGui.QFont()
         self.tickfont.setPixelSize(20)
-        for i in range(self.no_plots): 
-            if i % 3 ==0:
-                self.window.nextRow()
-            self.graphs.append(self.window.addPlot(title = self.title))
-            self.graphs[i].addLegend()
-            self.graphs[i].showGrid(x = True, y = True)
-            self.graphs[i].getAxis("bottom").setTickFont(self.tickfont)
-            self.graphs[i].getAxis("left").setTickFont(self.tickfont)
-
         self.styling = {"font-size": "20px", "color": "grey"}
-
+        if self.stacked:
+            self.setup_stacked()
+        else:
+            self.setup_grid()
         self.set_xlabel(self.xlabel)
         self.set_ylabel(self.ylabel)
+        self.add_overlay(self.graphs[0].getViewBox())
+        return self
 
-        # creating maybe multiple line plot subclass objects for the self.graph object, store in list
-        self.data_store = [[]]
-        ### storing lineplot instances into list, with indexed data store list
-        for i in range(self.no_plots):
+    def setup_grid(self):
+        cells = min(self.page_size or self.no_plots, self.no_plots)
+        for i in range(cells):
+            if i % self.columns == 0:
+                self.canvas.nextRow()
+            graph = self.canvas.addPlot(title = self.title)
+            graph.showGrid(x = True, y = True)
+            graph.getAxis("bottom").setTickFont(self.tickfont)
+            graph.getAxis("left").setTickFont(self.tickfont)
+            self.legends.append(graph.addLegend())
             ### setting pen as integer makes line colour cycle through 9 hues by default
             ### check pyqtgraph documentation on styling...it's quite messy
-            self.plot.append(self.graphs[i].plot(pen=i, name = f"Channel {self.plot_labels[i]}!!!")
-                if self.plot_labels
-                else self.graphs[i].plot(pen=i, name = f"Channel {i+1}!!!"))
-            
-            legend = self.graphs[i].addLegend()
-            self.data_store.append(self.initial_ydata)
-        
+            self.plot.append(graph.plot(pen=i, name = self.channel_name(i)))
+            self.graphs.append(graph)
+            self.watch_view(graph.getViewBox())
+            self.watch_scale(graph.getViewBox())
+            if self.scale_policy != "auto":
+                self.cell_bounds.append(self.new_bounds())
+        return self
+
+    def setup_stacked(self):
+        graph = self.canvas.addPlot(title = self.title)
+        graph.showGrid(x = True, y = True)
+        graph.getAxis("bottom").setTickFont(self.tickfont)
+        graph.getAxis("left").setTickFont(self.tickfont)
+        ### lane i is centred on -i * lane, channel 1 on top
+        self.lane = self.spacing or 1.
+        graph.getAxis("left").setTicks(
+            [[(-i * self.lane, self.channel_name(i)) for i in range(self.no_plots)]]
+        )
+        ### one path for every channel, connect breaks it between channels
+        self.path = pg.PlotCurveItem(pen=0)
+        graph.addItem(self.path)
+        self.graphs.append(graph)
+        self.plot.append(self.path)
+        viewbox = graph.getViewBox()
+        self.watch_view(viewbox)
+        viewbox.sigYRangeChanged.connect(self.redecimate)
+        return self
+
+    def eventFilter(self, obj, event):
+        if obj is self.window and event.type() == QtCore.QEvent.KeyPress:
+            if event.key() == QtCore.Qt.Key_PageDown:
+                self.set_page(self.page + 1)
+            elif event.key() == QtCore.Qt.Key_PageUp:
+                self.set_page(self.page - 1)
+        return super().eventFilter(obj, event)
+
+    def set_page(self, page):
+        if self.stacked or not self.page_size:
+            return self
+        pages = -(-self.no_plots // len(self.plot))
+        page = min(max(page, 0), pages - 1)
+        if page == self.page:
+            return self
+        self.page = page
+        ### the plots show other channels now
+        self.reset_bounds()
+        first = page * len(self.plot)
+        for i, (legend, curve) in enumerate(zip(self.legends, self.plot)):
+            legend.clear()
+            if first + i < self.no_plots:
+                legend.addItem(curve, self.channel_name(first + i))
+            else:
+                curve.setData([], [])
+        if self.full_data is not None:
+            self.set_data(self.full_data)
+        return self
+
     def set_xlabel(self, label):
-        for i in range(self.no_plots):
-            self.graphs[i].setLabel('bottom', label, **self.styling)
+        for graph in self.graphs:
+            graph.setLabel('bottom', label, **self.styling)
         return self
     def set_ylabel(self, label):
-        for i in range(self.no_plots):
-            self.graphs[i].setLabel('left', label, **self.styling)
+        for graph in self.graphs:
+            graph.setLabel('left', label, **self.styling)
         return self
 
     def set_data(self, data):
-        for i in range(self.no_plots):
-            self.data_store[i] = data[i]
-            self.plot[i].setData(np.arange(len(data[i])), data[i])
+        self.full_data = data
+        x, channels = self.split_xy(data)
+        if self.stacked:
+            return self.set_stacked(x, channels)
+        first = self.page * len(self.plot)
+        for i, (graph, curve) in enumerate(zip(self.graphs, self.plot)):
+            if first + i >= min(self.no_plots, len(channels)):
+                break
+            viewbox = graph.getViewBox()
+            xs, ys = self.decimated(viewbox, channels[first + i], x)
+            curve.setData(xs, ys)
+            if self.cell_bounds:
+                extent = self.extent(x, channels.shape[-1])
+                self.scale_view(viewbox, self.cell_bounds[i], extent, [ys], channels[first + i])
+        return self
+
+    def reset_bounds(self):
+        for bounds in self.cell_bounds:
+            bounds.reset()
+        return self
+
+    def track_chunk(self, chunk):
+        if self.cell_bounds:
+            rows = self.split_xy(chunk)[1]
+            first = self.page * len(self.plot)
+            for bounds, row in zip(self.cell_bounds, rows[first : self.no_plots]):
+                bounds.chunk(row)
+        return self
+
+    def visible_lanes(self, viewbox, n):
+        if viewbox.autoRangeEnabled()[1]:
+            ### auto ranging y follows whatever is drawn, so draw it all
+            return 0, n
+        lo, hi = viewbox.viewRange()[1]
+        first = int(np.floor(-hi / self.lane)) - 1
+        last = int(np.ceil(-lo / self.lane)) + 2
+        return min(max(first, 0), n), min(max(last, 0), n)
+
+    def set_stacked(self, x, channels):
+        channels = np.asarray(channels)
+        n = min(self.no_plots, len(channels))
+        viewbox = self.graphs[0].getViewBox()
+        first, last = self.visible_lanes(viewbox, n)
+        if first == last:
+            self.path.setData([], [])
+            return self
+        ### one decimation pass and one path upload for every visible lane
+        xs, ys = self.decimated(viewbox, channels[first:last], x)
+        offsets = -np.arange(first, last, dtype=float)[:, None] * self.lane
+        if self.spacing is None:
+            low = ys.min(axis=1, keepdims=True)
+            span = ys.max(axis=1, keepdims=True) - low
+            span[span == 0] = 1
+            ys = (ys - low) / span * 0.8 - 0.4 + offsets
+        else:
+            ys = ys + offsets
+        connect = np.ones(ys.shape, dtype=bool)
+        connect[:, -1] = False
+        self.path.setData(
+            np.tile(xs, last - first), ys.ravel(), connect=connect.ravel()
+        )
         return self
 
 class __LiveHeatMap__(__LiveWindowLike__):
-    
-    def __init__(self, **kwargs):
+    """
+    LiveHeatMap draws frames as an image through a fixed 256 entry colour
+    lookup table. Frames are quantised to uint8 against the current levels,
+    so pyqtgraph renders them through its cached effective LUT instead of
+    rescaling floats on every paint.
+
+    levels=(low, high) pins the levels (the colour bar can still drag them),
+    levels="auto" (or "decay") tracks the data: levels widen at once and
+    relax inwards by level_decay per frame, "grow" only ever widens them and
+    "percentile" tracks the level_percentile and 100 - level_percentile of
+    a sample of each frame instead. Pixels are only re-quantised when the
+    levels moved by more than 2% of the span.
+
+    stream=True turns the window into a scrolling waterfall: new columns
+    (agent.push(key, rows) with rows (n, bins)) land in a preallocated ring of
+    `history` columns and only the new columns are quantised per frame,
+    tracked levels then cover the min/max of the columns in view.
+    """
+
+    def __init__(self, levels=(0, 100), level_decay=0.05, level_percentile=1., **kwargs):
+        if isinstance(levels, str) and levels == "auto":
+            levels = "decay"
+        policy, limits = scale_policy(levels)
+        self.levels = __Bounds__(
+            policy,
+            limits,
+            level_decay,
+            level_percentile,
+            window=kwargs.get("history", 1000) if kwargs.get("stream") else None,
+        )
+        self.pixels = None
+        self.scratch = None
+        self.pixel_ring = None
 
         super().__init__(**kwargs)
         self.setup_plots()
-        self.worker.start()
+        self.start_worker()
 
     def setup_plots(self):
         self.initial_data = np.fromfunction(lambda i, j: (1+0.3*np.sin(i)) * (i)**2 + (j)**2, (100, 100))
 
-        self.graph = self.window.addPlot(title=self.title)
+        self.graph = self.canvas.addPlot(title=self.title)
         self.graph.setTitle(self.title, color="grey", size="20pt")
 
         legend = self.graph.addLegend()
@@ -235,12 +892,22 @@ class __LiveHeatMap__(__LiveWindowLike__):
         self.set_xlabel(self.xlabel)
         self.set_ylabel(self.ylabel)
 
-        self.img = pg.ImageItem(image=self.initial_data) # create monochrome image from demonstration data
-        self.graph.addItem(self.img)            # add to PlotItem 'plot'
         self.cm = pg.colormap.get('CET-L17') # prepare a linear color map
-        self.bar = pg.ColorBarItem( values= (0, 100), cmap=self.cm ) # prepare interactive color bar
-        # Have ColorBarItem control colors of img and appear in 'plot':
-        self.bar.setImageItem(self.img, insert_in = self.graph ) 
+        ### image holds uint8 indices into a fixed lut, so levels stay (0, 255)
+        self.img = pg.ImageItem()
+        self.img.setLookupTable(self.cm.getLookupTable(nPts=256))
+        self.img.setLevels((0, 255))
+        self.graph.addItem(self.img)            # add to PlotItem 'plot'
+        self.update_levels(self.initial_data)
+        self.bar = pg.ColorBarItem( values= self.levels.shown, cmap=self.cm ) # prepare interactive color bar
+        # color bar only shows the data levels, dragging it pins new levels
+        self.graph.layout.addItem(self.bar, 2, 5)
+        self.graph.layout.setColumnFixedWidth(4, 5)
+        self.bar.sigLevelsChanged.connect(self.pin_levels)
+        self.set_data(self.initial_data)
+        ### placeholder frame must not hold auto levels open
+        self.levels.reset()
+        self.add_overlay(self.graph.getViewBox())
         return self
 
     def set_xlabel(self, label):
@@ -250,7 +917,77 @@ class __LiveHeatMap__(__LiveWindowLike__):
     def set_ylabel(self, label):
         self.graph.setLabel("left", label, **self.styling)
         return
-    
+
+    def pin_levels(self, bar):
+        self.levels = __Bounds__("fixed", tuple(bar.levels()))
+        self.requantize()
+        return
+
+    def update_levels(self, data):
+        """
+        Returns True when the shown levels moved (and pixels need requantising).
+        """
+        if self.levels.policy == "fixed" or data.size == 0:
+            return False
+        ### strided sample keeps the min/max scan cheap on large frames
+        sample = data[tuple(slice(None, None, max(n // 256, 1)) for n in data.shape)]
+        if self.stream:
+            ### waterfall: only the new columns are scanned
+            self.levels.chunk(data)
+        else:
+            self.levels.frame(sample)
+        if not self.levels.settle(sample):
+            return False
+        if hasattr(self, "bar"):
+            self.bar.setLevels(self.levels.shown, update_items=False)
+        return True
+
+    def quantize(self, data, out=None):
+        lo, hi = self.levels.shown
+        if self.scratch is None or self.scratch.shape != data.shape:
+            self.scratch = np.empty(data.shape, dtype=np.float32)
+        np.subtract(data, lo, out=self.scratch, casting="unsafe")
+        np.multiply(self.scratch, 255 / max(hi - lo, 1e-12), out=self.scratch)
+        np.clip(self.scratch, 0, 255, out=self.scratch)
+        if out is None or out.shape != data.shape:
+            out = np.empty(data.shape, dtype=np.uint8)
+        np.copyto(out, self.scratch, casting="unsafe")
+        return out
+
+    def requantize(self):
+        if self.ring is not None:
+            self.pixel_ring.buffer = self.quantize(self.ring.buffer, self.pixel_ring.buffer)
+            self.img.updateImage(self.pixel_ring.view().T)
+        elif self.full_data is not None:
+            self.set_data(self.full_data)
+        return self
+
+    def append_data(self, chunk):
+        ### waterfall: chunk is (bins, new columns)
+        chunk = np.atleast_2d(chunk)
+        if self.ring is None or self.ring.channels != chunk.shape[0]:
+            self.ring = __RingBuffer__(chunk.shape[0], self.history, chunk.dtype)
+            self.pixel_ring = __RingBuffer__(chunk.shape[0], self.history, np.uint8)
+        self.ring.extend(chunk)
+        if self.update_levels(chunk):
+            self.pixel_ring.buffer = self.quantize(self.ring.buffer, self.pixel_ring.buffer)
+            self.pixel_ring.head = self.ring.head
+            self.pixel_ring.count = self.ring.count
+        else:
+            self.pixel_ring.extend(self.quantize(chunk))
+        ### time runs along x, newest column on the right
+        self.img.updateImage(self.pixel_ring.view().T)
+        return self
+
+    def release(self):
+        self.pixels = None
+        self.scratch = None
+        self.pixel_ring = None
+        return super().release()
+
     def set_data(self, data):
-        self.img.updateImage(data)
+        self.full_data = data
+        self.update_levels(data)
+        self.pixels = self.quantize(data, self.pixels)
+        self.img.updateImage(self.pixels)
         return 
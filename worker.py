@@ -23,15 +23,166 @@ class __WorkerBee__(QtCore.QThread):
         self.isHidden = isHidden_toggle
         self.data_func = data_func
         self.refresh_interval = refresh_interval
+        self.running = True
+        self.paused = False  ### set by the RefreshGovernor, no pulls meanwhile
+        ### the frame emitted last: "queued" until the window's update()
+        ### takes it, "drawn" until the plot process loop comes round and
+        ### clears it, so a slow GUI thread never gets more than one frame
+        ### per window queued and a window only reads its next frame once
+        ### the last one went through update() (see main_loop)
+        self.pending = None
+
+    def stop(self):
+        ### the window is going away, never touch it again
+        self.running = False
+        return self
 
     def run(self):
 
-        while not self.isHidden():
-            data = self.data_func()
-            self.signal1.emit(data)
-            time.sleep(self.refresh_interval)
+        while self.running and not self.isHidden():
+            if self.paused:
+                time.sleep(self.refresh_interval)
+            elif self.pending is not None:
+                ### last frame not drawn yet, check back soon
+                time.sleep(min(self.refresh_interval, 0.005))
+            else:
+                self.pending = "queued"
+                data = self.data_func()
+                self.signal1.emit(data)
+                time.sleep(self.refresh_interval)
         self.quit()
         print("WorkerBee vi saluta")
-        self.signal2.emit(True)
+        if self.running:
+            self.signal2.emit(True)
+
+
+
+class __RenderClock__(QtCore.QObject):
+    """
+    RenderClock is the single render tick of the plot process, used instead
+    of one WorkerBee thread per window. Every interval seconds it pulls the
+    newest data for every window whose rate divisor is due and then updates
+    those windows in one batch from the GUI thread.
+    """
+
+    def __init__(self, interval):
+        super().__init__()
+        self.interval = interval
+        self.tick_no = 0
+        self.windows = {}
+        self.timer = QtCore.QTimer()
+        self.timer.timeout.connect(self.tick)
+        self.timer.start(max(int(interval * 1000), 1))
+
+    def add(self, key, window):
+        self.windows[str(key)] = window
+        return self
+
+    def remove(self, key):
+        self.windows.pop(str(key), None)
+        return self
+
+    def tick(self):
+        self.tick_no += 1
+        due = []
+        for key, window in list(self.windows.items()):
+            ### a window refreshing every refresh_interval is updated once
+            ### every `divisor` ticks, read each tick as it may be governed
+            divisor = max(int(round(window.refresh_interval / self.interval)), 1)
+            if self.tick_no % divisor:
+                continue
+            if window.isHidden():
+                self.remove(key)
+                window.self_destruct(True)
+                continue
+            if window.paused:
+                continue
+            due.append((window, window.data_func()))
+        for window, data in due:
+            window.update(data)
+        return self
+
+    def stop(self):
+        self.timer.stop()
+        self.windows.clear()
+        return self
+
+class __RefreshGovernor__:
+    """
+    RefreshGovernor spreads a render budget, the fraction of the GUI thread
+    the windows of a plot process may spend drawing, over those windows.
+    Polled from the plot process loop (a QTimer of its own would starve
+    while the GUI thread is behind), every interval seconds it reads each
+    window's measured render cost (update plus paint), gives the focused
+    window focus_weight shares of the budget and every other visible window
+    one, and sets each refresh interval to what its share pays for: never
+    faster than the refresh_interval the window was opened with, never
+    slower than MAX_INTERVAL. Budget left over by windows already at their
+    own rate goes to the others. Minimized or unexposed windows are paused,
+    on_pause(key, paused) hears about every change.
+    """
+
+    MAX_INTERVAL = 2.
+
+    def __init__(self, budget, windows, on_pause, interval=0.5, focus_weight=4.):
+        self.budget = budget
+        self.windows = windows  ### the plot process {key: window}, read only
+        self.on_pause = on_pause
+        self.focus_weight = focus_weight
+        self.paused = set()
+        self.interval = interval
+        self.tick_time = 0.
+
+    def poll(self):
+        if time.time() - self.tick_time >= self.interval:
+            self.tick_time = time.time()
+            self.tick()
+        return self
+
+    def tick(self):
+        shares = {}
+        for key, window in list(self.windows.items()):
+            window.watch_paint()
+            visibility = window.visibility()
+            paused = visibility == "hidden"
+            if paused != (key in self.paused):
+                if paused:
+                    self.paused.add(key)
+                else:
+                    self.paused.discard(key)
+                self.on_pause(key, paused)
+            if paused:
+                window.set_refresh(window.base_interval, True)
+            else:
+                shares[key] = self.focus_weight if visibility == "active" else 1.
+        ### closed windows
+        self.paused &= set(self.windows)
 
+        for key, interval in self.plan(shares).items():
+            self.windows[key].set_refresh(interval, False)
+        return self
 
+    def plan(self, shares):
+        ### water filling: windows that do not need their whole share run at
+        ### their own rate and hand the rest of it to the others
+        intervals = {}
+        budget = self.budget
+        while shares:
+            total = sum(shares.values())
+            capped = {}
+            for key, weight in shares.items():
+                window = self.windows[key]
+                if window.render_cost() <= budget * weight / total * window.base_interval:
+                    capped[key] = window.base_interval
+            if not capped:
+                break
+            for key, interval in capped.items():
+                intervals[key] = interval
+                budget -= self.windows[key].render_cost() / interval
+                shares.pop(key)
+        total = sum(shares.values())
+        for key, weight in shares.items():
+            share = max(budget, 0.) * weight / total
+            cost = self.windows[key].render_cost()
+            intervals[key] = min(cost / share, self.MAX_INTERVAL) if share > 0 else self.MAX_INTERVAL
+        return intervals